@@ -0,0 +1,201 @@
+'description: particle advection - integrating drifter trajectories through the velocity field of any model'
+
+##### import packages #####
+import numpy as np
+import pandas as pd
+from model_classes import Model
+from spatial_index import EARTH_RADIUS
+
+MAX_LATITUDE = 89.99 # the longitude rate 1/cos(lat) is capped here near the poles
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% VELOCITY FIELDS %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+
+def velocity_field(model:Model,covariates=None):
+    '''
+    returns: function of (lon, lat, t) returning the (N,2) velocities [u,v] in m/s predicted by model at
+             the N positions, through its vectorised `predict`
+
+    params:
+    [Model] model: fitted model
+    covariates: function of (lon, lat, t) returning a dict (or dataframe) of any further columns the model
+                predicts from (e.g. covariate_labels, or `time` for a monthly GriddedCurrentModel). t is the
+                time in seconds since the start of the integration
+    '''
+    def field(lon,lat,t):
+        data = pd.DataFrame({"lon":lon,"lat":lat})
+        if covariates is not None:
+            for label,values in dict(covariates(lon,lat,t)).items():
+                data[label] = np.asarray(values)
+        return np.asarray(model.predict(data),dtype=float)
+    return field
+
+def degrees_per_second(lat,velocity):
+    '''
+    returns: (N,2) rates of change of [lon,lat] in degrees/s of particles at latitudes lat moving with
+             velocity [u,v] (m/s) along the sphere (east and north velocities over the radius of the
+             circle of latitude and of the earth)
+    '''
+    cos_lat = np.cos(np.deg2rad(np.clip(lat,-MAX_LATITUDE,MAX_LATITUDE)))
+    return np.rad2deg(np.column_stack((velocity[:,0]/(EARTH_RADIUS*cos_lat),velocity[:,1]/EARTH_RADIUS)))
+
+def wrap_positions(lon,lat):
+    'returns: lon wrapped into [-180,180) and lat clipped to [-90,90]'
+    return np.mod(lon+180.,360.)-180., np.clip(lat,-90.,90.)
+
+def degrees_to_metres(lat,displacement):
+    'returns: (N,) lengths in metres of small [lon,lat] displacements (degrees) at latitudes lat'
+    east = np.deg2rad(displacement[:,0])*EARTH_RADIUS*np.cos(np.deg2rad(lat))
+    north = np.deg2rad(displacement[:,1])*EARTH_RADIUS
+    return np.hypot(east,north)
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% INTEGRATORS %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+''' every step advances all particles at once: positions are (N,) lon and lat arrays and every
+    stage is one vectorised evaluation of the velocity field. '''
+
+def _rate(field,lon,lat,t):
+    lon,lat = wrap_positions(lon,lat)
+    return degrees_per_second(lat,field(lon,lat,t))
+
+def euler_step(field,lon,lat,t:float,dt:float):
+    'returns: positions after one forward euler step of dt seconds'
+    k1 = _rate(field,lon,lat,t)
+    return wrap_positions(lon+dt*k1[:,0],lat+dt*k1[:,1])
+
+def rk4_step(field,lon,lat,t:float,dt:float):
+    'returns: positions after one classical fourth order runge-kutta step of dt seconds'
+    k1 = _rate(field,lon,lat,t)
+    k2 = _rate(field,lon+dt/2*k1[:,0],lat+dt/2*k1[:,1],t+dt/2)
+    k3 = _rate(field,lon+dt/2*k2[:,0],lat+dt/2*k2[:,1],t+dt/2)
+    k4 = _rate(field,lon+dt*k3[:,0],lat+dt*k3[:,1],t+dt)
+    increment = dt/6*(k1+2*k2+2*k3+k4)
+    return wrap_positions(lon+increment[:,0],lat+increment[:,1])
+
+def rk23_step(field,lon,lat,t:float,dt:float):
+    '''
+    returns: (lon, lat, error) - positions after one bogacki-shampine step of dt seconds (third order)
+             and the largest distance in metres between the third and embedded second order positions
+    '''
+    k1 = _rate(field,lon,lat,t)
+    k2 = _rate(field,lon+dt/2*k1[:,0],lat+dt/2*k1[:,1],t+dt/2)
+    k3 = _rate(field,lon+3*dt/4*k2[:,0],lat+3*dt/4*k2[:,1],t+3*dt/4)
+    increment = dt*(2*k1+3*k2+4*k3)/9
+    new_lon,new_lat = lon+increment[:,0],lat+increment[:,1]
+    k4 = _rate(field,new_lon,new_lat,t+dt)
+    difference = dt*(-5*k1/72+k2/12+k3/9-k4/8)
+    error = degrees_to_metres(lat,difference)
+    return (*wrap_positions(new_lon,new_lat), np.nanmax(error) if error.size else 0.)
+
+steppers = {"euler":euler_step,"rk4":rk4_step}
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% TRAJECTORIES %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+
+class TrajectoryWriter:
+    '''
+    collects particle positions and appends them in chunks of chunk_rows rows to a table in an HDF5
+    store (columns particle, time, lon, lat), so that long integrations of large ensembles stream to
+    disk instead of being held in memory. use as a context manager (or call `close`).
+    '''
+    def __init__(self,path:str,key:str="trajectories",chunk_rows:int=1_000_000):
+        self.path = path
+        self.key = key
+        self.chunk_rows = chunk_rows
+        self._store = pd.HDFStore(path,mode="a")
+        if key in self._store:
+            self._store.remove(key)
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def write(self,t:float,lon,lat):
+        self._buffer.append(pd.DataFrame({"particle":np.arange(lon.shape[0]),"time":np.full(lon.shape[0],t),
+                                          "lon":lon,"lat":lat}))
+        self._buffered_rows += lon.shape[0]
+        if self._buffered_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._store.append(self.key,pd.concat(self._buffer,ignore_index=True),format="table",index=False)
+            self._buffer = []
+            self._buffered_rows = 0
+
+    def close(self):
+        self.flush()
+        self._store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+def advect(model,lon,lat,duration:float,dt:float,method:str="rk4",covariates=None,tolerance:float=10.,
+           save_interval:int=1,path:str=None,key:str="trajectories",chunk_rows:int=1_000_000):
+    '''
+    returns: (times, lon, lat) - the saved times (seconds since the start) and (T,N) positions of the N
+             particles, or only the final positions (as (1,N) arrays at the final time) when streaming to path
+
+    params:
+    [Model or function] model: fitted model whose `predict` is the velocity field, or a function of
+                               (lon, lat, t) returning (N,2) velocities in m/s
+    [array] lon, lat: initial particle positions in degrees
+    [float] duration: integration time in seconds (negative for backward trajectories)
+    [float] dt: time step in seconds (the initial step for `rk23`)
+    [str] method: `rk4` (default), `euler` or `rk23` - adaptive bogacki-shampine steps that keep the
+                  largest per-step position error of the ensemble below tolerance
+    covariates: function of (lon, lat, t) returning the further columns the model predicts from (see velocity_field)
+    [float] tolerance: largest position error per `rk23` step, in metres
+    [int] save_interval: save the positions every save_interval steps
+    [str] path: HDF5 file to stream the trajectories to (see TrajectoryWriter) instead of returning them
+    '''
+    field = velocity_field(model,covariates) if isinstance(model,Model) else model
+    if method not in (*steppers,"rk23"):
+        raise ValueError("method must be one of `rk4`, `euler` or `rk23`")
+    # each of these would otherwise never finish (or fail only after the first steps were written)
+    if not np.isfinite(duration):
+        raise ValueError("duration must be a finite number of seconds")
+    if not np.isfinite(dt) or dt == 0:
+        raise ValueError("dt must be a finite, non-zero number of seconds")
+    if method == "rk23" and not tolerance > 0:
+        raise ValueError("tolerance must be a positive number of metres")
+    if int(save_interval) != save_interval or save_interval < 1:
+        raise ValueError("save_interval must be a positive whole number of steps")
+    lon,lat = Model.check_coordinates_batch(lon,lat)
+    lon,lat = wrap_positions(lon.copy(),lat.copy())
+    dt = np.copysign(abs(dt),duration)
+    writer = TrajectoryWriter(path,key,chunk_rows) if path is not None else None
+    times,positions = [0.],[(lon,lat)]
+    if writer is not None:
+        writer.write(0.,lon,lat)
+    t,step = 0.,0
+    try:
+        while abs(t) < abs(duration):
+            step_dt = dt if abs(t+dt) < abs(duration) else duration-t
+            if method == "rk23":
+                new_lon,new_lat,error = rk23_step(field,lon,lat,t,step_dt)
+                factor = 0.9*(tolerance/error)**(1/3) if error > 0 else 5.
+                if error > tolerance:
+                    dt = step_dt*max(factor,0.2)
+                    continue
+                dt = step_dt*min(factor,5.) if step_dt == dt else dt
+            else:
+                new_lon,new_lat = steppers[method](field,lon,lat,t,step_dt)
+            lon,lat,t,step = new_lon,new_lat,t+step_dt,step+1
+            if step % save_interval == 0 or abs(t) >= abs(duration):
+                if writer is not None:
+                    writer.write(t,lon,lat)
+                else:
+                    times.append(t)
+                    positions.append((lon,lat))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        return np.array([t]), lon[None,:], lat[None,:]
+    return np.array(times), np.stack([p[0] for p in positions]), np.stack([p[1] for p in positions])
+
+def read_trajectories(path:str,key:str="trajectories"):
+    '''returns: (times, lon, lat) - the trajectories streamed to path by advect, as (T,) and (T,N) arrays'''
+    table = pd.read_hdf(path,key)
+    lon = table.pivot(index="time",columns="particle",values="lon")
+    lat = table.pivot(index="time",columns="particle",values="lat")
+    return lon.index.to_numpy(), lon.to_numpy(), lat.to_numpy()
@@ -1,4 +1,6 @@
 from model_classes import Model
+from fixed_current_map import CurrentMap
+from instrumentation import instrumented, rows_of_argument
 # import packages
 import numpy as np
 
@@ -12,8 +14,13 @@ class BathtubModel(Model):
     #------------------------ model constructions -------------------------#
     @staticmethod
     def bathtub(lon,lat):
-        __class__.check_coordinates(lon,lat)
-        return np.zeros(2)
+        return __class__.bathtub_batch([lon],[lat])[0]
+
+    @staticmethod
+    def bathtub_batch(lon,lat):
+        '''returns an (N,2) array of zero velocities, one row per position'''
+        lon,lat = __class__.check_coordinates_batch(lon,lat)
+        return np.zeros((lon.shape[0],2))
 
     #----------------------- 'immutable' properties -----------------------#
     @property
@@ -22,11 +29,16 @@ class BathtubModel(Model):
     
     @property
     def trained_prediction(self):
-        return [self.model_function(lon,lat) for lon,lat in np.array(self.training_data[["lon","lat"]])]
+        return self._cached(("prediction","train"),lambda: self.predict(self.training_data))
     
     @property
     def testing_prediction(self):
-        return [self.model_function(lon,lat) for lon,lat in np.array(self.training_data[["lon","lat"]])]
+        return self._cached(("prediction","test"),lambda: self.predict(self.test_data))
+
+    #----------------------- predictions -----------------------#
+    @instrumented(rows=rows_of_argument(1))
+    def predict(self,data):
+        return self.bathtub_batch(*self.coordinates(data))
 
 class SBRModel(Model):
     '''benchmark model: predicts velocities according to a steady solid body rotation model.'''
@@ -39,9 +51,13 @@ class SBRModel(Model):
     #------------------------ model constructions -------------------------#
     @staticmethod
     def sbr(lon:float,lat:float,f0:float):
-        __class__.check_coordinates(lon,lat)
-        
-        return np.array([-f0*lat,f0*lon])
+        return __class__.sbr_batch([lon],[lat],f0)[0]
+
+    @staticmethod
+    def sbr_batch(lon,lat,f0:float):
+        '''returns an (N,2) array of solid body rotation velocities [-f0*lat, f0*lon]'''
+        lon,lat = __class__.check_coordinates_batch(lon,lat)
+        return np.column_stack((-f0*lat,f0*lon))
     # -------------------------properties and setters ------------------------------#
     @property
     def f0(self):
@@ -54,6 +70,7 @@ class SBRModel(Model):
         except:
             raise ValueError("coriolis parameter, f0, must be a real number")
         self._f0 = val
+        self.clear_predictions()
 
     # -----------'immutable' properties -----------#
     @property
@@ -62,11 +79,20 @@ class SBRModel(Model):
     
     @property
     def trained_prediction(self):
-        return [self.model_function(lon,lat,self.f0) for lon,lat in np.array(self.training_data[["lon","lat"]])]
+        return self._cached(("prediction","train"),lambda: self.predict(self.training_data))
     
     @property
     def testing_prediction(self):
-        return [self.model_function(lon,lat,self.f0) for lon,lat in np.array(self.test_data[["lon","lat"]])]
+        return self._cached(("prediction","test"),lambda: self.predict(self.test_data))
+
+    #----------------------- predictions -----------------------#
+    @instrumented(rows=rows_of_argument(1))
+    def predict(self,data):
+        return self.sbr_batch(*self.coordinates(data),self.f0)
+
+    #----------------------- persistence -----------------------#
+    def artifact_state(self):
+        return {}, {"f0":float(self.f0)}, {}
 
 class FixedCurrentModel(Model):
     '''benchmark model: predicts all drifter velocities to be the average velocity across the 
@@ -80,20 +106,26 @@ class FixedCurrentModel(Model):
     #------------------------ model constructions -------------------------#
     @staticmethod
     def fixedcurrent(lon:float,lat:float,current):
-        __class__.check_coordinates(lon,lat)
-        return current
+        return __class__.fixedcurrent_batch([lon],[lat],current)[0]
+
+    @staticmethod
+    def fixedcurrent_batch(lon,lat,current):
+        '''returns an (N,2) array with the fixed current repeated at every position'''
+        lon,lat = __class__.check_coordinates_batch(lon,lat)
+        return np.tile(np.asarray(current,dtype=float),(lon.shape[0],1))
     
     #----------------------- 'immutable' properties -----------------------#
     @property
     def av_drifter_velocity(self):
+        '(setter) average velocity of the training data - computed on first access if set to None'
+        if self._av_drifter_velocity is None:
+            self._av_drifter_velocity = np.mean(self.observations("train"),axis=0)
         return self._av_drifter_velocity
     
     @av_drifter_velocity.setter
     def av_drifter_velocity(self,val):
-        if val is None:
-            self._av_drifter_velocity = np.mean(np.array(self.training_data[["u","v"]]),axis=0)
-        else:
-            self._av_drifter_velocity = val
+        self.clear_predictions()
+        self._av_drifter_velocity = val
             
     @property
     def model_function(self):
@@ -101,10 +133,124 @@ class FixedCurrentModel(Model):
     
     @property
     def trained_prediction(self):
-        return [self.model_function(lon,lat,self.av_drifter_velocity)\
-                 for lon,lat in np.array(self.training_data[["lon","lat"]])]
+        return self._cached(("prediction","train"),lambda: self.predict(self.training_data))
     
     @property
     def testing_prediction(self):
-        return [self.model_function(lon,lat,self.av_drifter_velocity)\
-                 for lon,lat in np.array(self.training_data[["lon","lat"]])]
+        return self._cached(("prediction","test"),lambda: self.predict(self.test_data))
+
+    #----------------------- predictions -----------------------#
+    @instrumented(rows=rows_of_argument(1))
+    def predict(self,data):
+        return self.fixedcurrent_batch(*self.coordinates(data),self.av_drifter_velocity)
+
+    def reset_fit(self):
+        self.av_drifter_velocity = None
+
+    #----------------------- persistence -----------------------#
+    def artifact_state(self):
+        return {"av_drifter_velocity":np.asarray(self.av_drifter_velocity,dtype=float)}, {}, {}
+
+class GriddedCurrentModel(Model):
+    '''benchmark model: predicts drifter velocities to be the average velocity of the drifter data in the
+       same grid cell (and, optionally, calendar month)'''
+
+    def __init__(self,loss_type:str,uncertainty_type:str,training_data,test_data,
+                 lon_size:float=1.,lat_size:float=1.,by_month:bool=False,time_column:str="time"):
+        super().__init__(loss_type,uncertainty_type,training_data,test_data)
+        self.model_type = "griddedcurrent"
+        self.lon_size = lon_size
+        self.lat_size = lat_size
+        self.by_month = by_month
+        self.time_column = time_column
+
+    #------------------------ model constructions -------------------------#
+    @staticmethod
+    def griddedcurrent(lon:float,lat:float,current_map,month=None):
+        return __class__.griddedcurrent_batch([lon],[lat],current_map,None if month is None else [month])[0]
+
+    @staticmethod
+    def griddedcurrent_batch(lon,lat,current_map,month=None):
+        '''returns an (N,2) array of the mean velocity of the grid cell containing every position'''
+        lon,lat = __class__.check_coordinates_batch(lon,lat)
+        return current_map.lookup(lon,lat,month)
+
+    # -------------------------properties and setters ------------------------------#
+    # the grid the current map is binned on: changing it discards the fitted map and everything derived from it
+    @property
+    def lon_size(self):
+        return self._lon_size
+
+    @lon_size.setter
+    def lon_size(self,val):
+        self._lon_size = val
+        self.clear_cache()
+
+    @property
+    def lat_size(self):
+        return self._lat_size
+
+    @lat_size.setter
+    def lat_size(self,val):
+        self._lat_size = val
+        self.clear_cache()
+
+    @property
+    def by_month(self):
+        return self._by_month
+
+    @by_month.setter
+    def by_month(self,val):
+        self._by_month = val
+        self.clear_cache()
+
+    @property
+    def time_column(self):
+        return self._time_column
+
+    @time_column.setter
+    def time_column(self,val):
+        self._time_column = val
+        self.clear_cache()
+
+    #----------------------- 'immutable' properties -----------------------#
+    @property
+    def current_map(self):
+        '(memoised) CurrentMap fitted to the training data'
+        return self._cached(("current_map","train"),
+                            lambda: CurrentMap(self.lon_size,self.lat_size,self.by_month,self.time_column).fit(self.training_data))
+
+    @property
+    def model_function(self):
+        return self.griddedcurrent
+
+    @property
+    def trained_prediction(self):
+        return self._cached(("prediction","train"),lambda: self.predict(self.training_data))
+
+    @property
+    def testing_prediction(self):
+        return self._cached(("prediction","test"),lambda: self.predict(self.test_data))
+
+    #----------------------- predictions -----------------------#
+    @instrumented(rows=rows_of_argument(1))
+    def predict(self,data):
+        current_map = self.current_map
+        month = current_map.months(data) if self.by_month else None
+        return self.griddedcurrent_batch(*self.coordinates(data),current_map,month)
+
+    #----------------------- persistence -----------------------#
+    map_arrays = ("count","mean_velocity","velocity_variance","mean_speed","lookup_velocity")
+
+    def artifact_state(self):
+        current_map = self.current_map
+        return ({name:getattr(current_map,name) for name in self.map_arrays},
+                {"lon_size":self.lon_size,"lat_size":self.lat_size,"by_month":self.by_month,"time_column":self.time_column},
+                {})
+
+    def restore_artifact_state(self,arrays,attributes,objects):
+        super().restore_artifact_state({},attributes,objects)
+        current_map = CurrentMap(self.lon_size,self.lat_size,self.by_month,self.time_column)
+        for name in self.map_arrays:
+            setattr(current_map,name,arrays[name])
+        self._cache[("current_map","train")] = current_map
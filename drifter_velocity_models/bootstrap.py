@@ -0,0 +1,175 @@
+'description: bootstrap confidence intervals for the loss and uncertainty metrics of a model'
+
+##### import packages #####
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from model_classes import Model
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% PER-ROW FEATURES %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+''' every metric is a function of the means of a few per-row features of the residuals, so the
+    residuals are reduced to an (N,k) feature matrix once and each bootstrap replicate only needs
+    the means of the resampled feature rows. the magnitudes are centred on their full-sample mean c
+    first: the mean deviation of a resample is then O(std/sqrt(N)), so its standard deviation
+    sqrt(mean(d^2)-mean(d)^2) does not cancel catastrophically however large c is next to the spread,
+    and its root mean square is recovered as sqrt(mean(d^2)+2c mean(d)+c^2). '''
+
+def velocity_features(residuals):
+    '''returns: ((N,2) per-row mean of the squared deviations of the residual components from their mean c
+                and mean of those deviations, c)'''
+    centre = np.mean(residuals)
+    deviations = residuals-centre
+    return np.column_stack((np.mean(np.square(deviations),axis=1),np.mean(deviations,axis=1))), centre
+
+def speed_direction_features(residuals):
+    '''returns: ((N,5) per-row squared deviation of the residual speed from its mean c, that deviation, squared
+                residual direction (arctan2) and the unit vector [cos, sin] in the residual direction (as in
+                ResidualStatistics), c)'''
+    speed = np.hypot(residuals[:,0],residuals[:,1])
+    centre = np.mean(speed)
+    deviations = speed-centre
+    direction = np.arctan2(residuals[:,1],residuals[:,0])
+    return np.column_stack((np.square(deviations),deviations,np.square(direction),np.cos(direction),np.sin(direction))), centre
+
+def _rms(mean_square,mean,centre):
+    'root mean square of the values from the moments of their deviations from centre'
+    return np.sqrt(np.maximum(mean_square+2*centre*mean+centre*centre,0.))
+
+def _std(mean_square,mean):
+    'standard deviation from the moments of the deviations from a centre close to the mean'
+    return np.sqrt(np.maximum(mean_square-np.square(mean),0.))
+
+def _circular_std(mean_cos,mean_sin):
+    return np.sqrt(-2*np.log(np.clip(np.hypot(mean_cos,mean_sin),1e-300,1.)))
+
+##### metric -> (feature set, components, function of the feature means (B,k) and the centre of the feature set
+##### returning one array per component) #####
+feature_sets = {"velocity":velocity_features,"speed_direction":speed_direction_features}
+
+metrics = {
+    "rmse":("velocity",("velocity",),
+            lambda means,centre: [Model.to_cm_per_second(_rms(means[:,0],means[:,1],centre))]),
+    "sre":("velocity",("velocity",),
+           lambda means,centre: [Model.to_cm_per_second(_std(means[:,0],means[:,1]))]),
+    "rms_s_d":("speed_direction",("speed","direction"),
+               lambda means,centre: [Model.to_cm_per_second(_rms(means[:,0],means[:,1],centre)),Model.to_degrees(np.sqrt(means[:,2]))]),
+    "sr_s_d":("speed_direction",("speed","direction"),
+              lambda means,centre: [Model.to_cm_per_second(_std(means[:,0],means[:,1])),Model.to_degrees(_circular_std(means[:,3],means[:,4]))]),
+}
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% RESAMPLING %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+
+def group_sums(features,groups):
+    '''returns: (G,k) feature sums and (G,) row counts per group (e.g. per drifter id)'''
+    _,inverse = np.unique(np.asarray(groups),return_inverse=True)
+    inverse = inverse.reshape(-1)
+    sizes = np.bincount(inverse).astype(float)
+    sums = np.column_stack([np.bincount(inverse,weights=column,minlength=sizes.size) for column in features.T])
+    return sums, sizes
+
+def resampled_means(features,num_replicates:int,rng,sizes=None,chunk_size:int=2**20):
+    '''
+    returns: (num_replicates,k) means of features over bootstrap resamples. the multinomial resample counts
+             of the rows are drawn a chunk of rows at a time - a binomial draw of how many of each replicate's
+             N draws fall in the chunk, then that many uniform draws within it - so only a
+             (num_replicates,chunk) block of counts exists at once, reduced with one matrix product per chunk
+
+    params:
+    [array] features: (N,k) per-row features, or per-block feature sums for a block bootstrap
+    [int] num_replicates: number of resamples
+    rng: numpy Generator
+    [array] sizes: (N,) rows per block for a block bootstrap (the means are then weighted by block size)
+    [int] chunk_size: resample counts held at once (num_replicates x rows per chunk)
+    '''
+    num_rows = features.shape[0]
+    chunk_rows = max(1,chunk_size//max(num_replicates,1))
+    remaining = np.full(num_replicates,num_rows,dtype=np.int64) # draws of each replicate not yet placed
+    offsets = np.arange(num_replicates)*chunk_rows
+    sums = np.zeros((num_replicates,features.shape[1]))
+    weights = np.zeros(num_replicates) if sizes is not None else np.full(num_replicates,float(num_rows))
+    for start in range(0,num_rows,chunk_rows):
+        stop = min(start+chunk_rows,num_rows)
+        draws = rng.binomial(remaining,(stop-start)/(num_rows-start))
+        remaining -= draws
+        index = rng.integers(0,stop-start,size=int(draws.sum()))+np.repeat(offsets,draws)
+        counts = np.bincount(index,minlength=num_replicates*chunk_rows).reshape(num_replicates,chunk_rows)[:,:stop-start]
+        counts = counts.astype(float)
+        sums += np.matmul(counts,features[start:stop])
+        if sizes is not None:
+            weights += np.matmul(counts,sizes[start:stop])
+    return sums/weights[:,None]
+
+def bootstrap_residuals(residuals,metric_types:List[str]=None,num_replicates:int=1000,confidence:float=0.95,
+                        groups=None,random_state=None,batch_size:int=None,max_workers:int=None):
+    '''
+    returns: dataframe with one row per metric component (e.g. `rms_s_d`/`direction`) holding the estimate
+             on the full residuals, the bootstrap confidence interval (percentile method) and standard error
+
+    params:
+    [array] residuals: (N,2) velocity residuals [u,v]
+    [list] metric_types: entries of Model.loss_functions/Model.uncertainty_functions (default: all of them)
+    [int] num_replicates: number of bootstrap replicates
+    [float] confidence: confidence level of the intervals
+    [array] groups: (N,) block labels (e.g. drifter ids) - whole blocks are resampled instead of rows
+    random_state: seed. the result does not depend on batch_size or max_workers
+    [int] batch_size: replicates drawn per batch (default 256)
+    [int] max_workers: threads drawing batches in parallel
+    '''
+    residuals = np.asarray(residuals,dtype=float)
+    if residuals.ndim != 2 or residuals.shape[1] != 2:
+        raise ValueError("Residual Velocities must be of the form [u,v]")
+    if metric_types is None:
+        metric_types = list(metrics)
+    unknown = [name for name in metric_types if name not in metrics]
+    if unknown:
+        raise ValueError(f"no bootstrap statistic for metric type(s) {unknown}")
+    features,centres = {},{}
+    for name in {metrics[metric][0] for metric in metric_types}:
+        features[name],centres[name] = feature_sets[name](residuals)
+    full_means = {name:np.mean(values,axis=0,keepdims=True) for name,values in features.items()}
+    sizes = None
+    if groups is not None:
+        groups = np.asarray(groups).reshape(-1)
+        if groups.shape[0] != residuals.shape[0]:
+            raise ValueError("groups must contain one label per residual")
+        for name in features:
+            features[name],sizes = group_sums(features[name],groups)
+    # every feature set is resampled with the same indices, as one feature matrix
+    names = list(features)
+    stacked = np.column_stack([features[name] for name in names])
+    columns = np.cumsum([0]+[features[name].shape[1] for name in names])
+
+    if batch_size is None:
+        batch_size = 256
+    batches = [min(batch_size,num_replicates-start) for start in range(0,num_replicates,batch_size)]
+    rngs = [np.random.default_rng(seed) for seed in np.random.SeedSequence(random_state).spawn(len(batches))]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        means = np.concatenate(list(executor.map(lambda batch,rng: resampled_means(stacked,batch,rng,sizes),batches,rngs)))
+
+    alpha = (1-confidence)/2
+    rows = []
+    for metric in metric_types:
+        feature_set,components,statistic = metrics[metric]
+        ii = names.index(feature_set)
+        estimates = statistic(full_means[feature_set],centres[feature_set])
+        replicates = statistic(means[:,columns[ii]:columns[ii+1]],centres[feature_set])
+        for component,estimate,values in zip(components,estimates,replicates):
+            lower,upper = np.nanquantile(values,[alpha,1-alpha])
+            rows.append({"metric":metric,"component":component,"estimate":estimate[0],
+                         "lower":lower,"upper":upper,"std_error":np.nanstd(values)})
+    return pd.DataFrame(rows)
+
+def bootstrap_loss(model:Model,test_or_train:str="test",metric_types:List[str]=None,num_replicates:int=1000,
+                   confidence:float=0.95,groups=None,random_state=None,batch_size:int=None,max_workers:int=None):
+    '''
+    returns: bootstrap_residuals of a model's residuals, computed once from its memoised observations and
+             predictions. metric_types defaults to the model's loss_type and uncertainty_type. groups may be a
+             column label of the data subset (e.g. `id` for a block bootstrap over drifters) or an array.
+    '''
+    if metric_types is None:
+        metric_types = [model.loss_type,model.uncertainty_type]
+    if isinstance(groups,str):
+        groups = model.data_subset(test_or_train)[groups]
+    residuals = Model.residuals(model.observations(test_or_train),np.asarray(model.prediction(test_or_train)))
+    return bootstrap_residuals(residuals,metric_types,num_replicates,confidence,groups,random_state,batch_size,max_workers)
@@ -0,0 +1,90 @@
+'description: lazy loading of the ocean drifter dataset - nothing is read from disk until it is first requested'
+
+##### import packages #####
+import os
+import pandas as pd
+from typing import List
+
+DEFAULT_PATH = "ocean_data.h5"
+
+##### loaded datasets, keyed by (absolute path, hdf key) #####
+_datasets = {}
+
+def load_data(path:str=DEFAULT_PATH,key:str=None,columns:List[str]=None,start:int=None,stop:int=None):
+    '''
+    returns: the drifter data stored in the hdf5 file at path as a dataframe. the file is only opened
+             on first use; the full dataset is then cached per path so later calls are free.
+
+    params:
+    [str] path: path to the hdf5 file
+    [str] key: group identifier in the hdf5 file (may be omitted if the file holds a single dataset)
+    [list] columns: only load these columns
+    [int] start, stop: only load rows start:stop
+
+    selections (columns/start/stop) are read straight from disk without loading the full dataset
+    when the file is stored in `table` format. `fixed` format files cannot be read partially, so
+    the full dataset is loaded (and cached) and the selection is taken from it.
+    '''
+    cache_key = (os.path.abspath(path),key)
+    if cache_key in _datasets:
+        return _select(_datasets[cache_key],columns,start,stop)
+    if columns is None and start is None and stop is None:
+        _datasets[cache_key] = _read(path,key)
+        return _datasets[cache_key]
+    try:
+        return _read(path,key,columns=columns,start=start,stop=stop)
+    except TypeError:
+        # fixed format stores only support being read in their entirety
+        _datasets[cache_key] = _read(path,key)
+        return _select(_datasets[cache_key],columns,start,stop)
+
+def iter_data(path:str=DEFAULT_PATH,key:str=None,chunksize:int=100_000,columns:List[str]=None):
+    '''
+    yields: the drifter data stored at path in consecutive dataframes of at most chunksize rows,
+            so that memory use is bounded by the chunk size rather than by the size of the dataset.
+
+    params:
+    [str] path: path to the hdf5 file
+    [str] key: group identifier in the hdf5 file (may be omitted if the file holds a single dataset)
+    [int] chunksize: maximum number of rows per chunk
+    [list] columns: only load these columns
+    '''
+    if chunksize < 1:
+        raise ValueError("chunksize must be a positive integer")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"drifter data file {path} does not exist")
+    with pd.HDFStore(path,mode="r") as store:
+        if key is None:
+            if len(store.keys()) != 1:
+                raise ValueError(f"{path} holds more than one dataset, pass a key")
+            key = store.keys()[0]
+        if store.get_storer(key).is_table:
+            yield from store.select(key,columns=columns,chunksize=chunksize)
+        else:
+            start = 0
+            while True:
+                chunk = store.select(key,start=start,stop=start+chunksize)
+                if len(chunk) == 0:
+                    break
+                yield _select(chunk,columns,None,None)
+                start += chunksize
+
+def clear_data_cache(path:str=None):
+    '''discards cached datasets - those loaded from path if given, otherwise all of them'''
+    if path is None:
+        _datasets.clear()
+    else:
+        for cache_key in [cache_key for cache_key in _datasets if cache_key[0] == os.path.abspath(path)]:
+            del _datasets[cache_key]
+
+def _read(path,key,**selection):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"drifter data file {path} does not exist")
+    return pd.read_hdf(path,key,**selection)
+
+def _select(frame,columns,start,stop):
+    if start is not None or stop is not None:
+        frame = frame.iloc[start:stop]
+    if columns is not None:
+        frame = frame.loc[:,columns]
+    return frame
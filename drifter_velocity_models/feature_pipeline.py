@@ -0,0 +1,189 @@
+'description: declarative pipeline of derived covariates, computed lazily and cached across model fits'
+
+##### import packages #####
+import collections
+import functools
+import weakref
+import numpy as np
+import pandas as pd
+from typing import List
+from fixed_current_map import drifter_speed
+from columnar_data import ColumnarData
+
+DAYS_PER_YEAR = 365.25
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% FEATURE FUNCTIONS %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+''' vectorised functions of whole columns. they are module-level functions so that pipelines
+    (and the models holding them) can be pickled by model_store.save_model. '''
+
+def sine_of_degrees(angle):
+    return np.sin(np.deg2rad(np.asarray(angle,dtype=float)))
+
+def cosine_of_degrees(angle):
+    return np.cos(np.deg2rad(np.asarray(angle,dtype=float)))
+
+def day_of_year(time):
+    'returns: fractional (zero-based) day of the year of every timestamp'
+    time = pd.DatetimeIndex(pd.to_datetime(np.asarray(time)))
+    return (time.dayofyear-1).to_numpy(dtype=float)+(time-time.normalize()).total_seconds().to_numpy()/86400.
+
+def annual_harmonic(time,order:int=1,kind:str="sin"):
+    'returns: sin or cos of 2*pi*order*(day of year)/365.25 for every timestamp'
+    phase = 2*np.pi*order*day_of_year(time)/DAYS_PER_YEAR
+    return np.sin(phase) if kind == "sin" else np.cos(phase)
+
+class Feature:
+    '''
+    a derived covariate: function applied to the input columns of a dataset (and keyword parameters).
+    its spec identifies the computation, so that cached values are reused only for the same feature.
+    '''
+    def __init__(self,function,inputs:List[str],**params):
+        self.function = function
+        self.inputs = list(inputs)
+        self.params = params
+
+    @property
+    def spec(self):
+        return (self.function.__module__,self.function.__qualname__,tuple(self.inputs),tuple(sorted(self.params.items())))
+
+    def compute(self,data):
+        'returns: (N,) array of the feature for every row of data'
+        return np.asarray(self.function(*(np.asarray(data[label]) for label in self.inputs),**self.params),dtype=float)
+
+def default_features(time_column:str="time"):
+    '''returns: dict of label -> Feature for the derived covariates available by default - drifter speed,
+                trigonometric encodings of lon and lat and the first two annual harmonics of the time'''
+    features = {"drifter_speed":Feature(drifter_speed,["u","v"])}
+    for coord in ("lon","lat"):
+        features[f"sin_{coord}"] = Feature(sine_of_degrees,[coord])
+        features[f"cos_{coord}"] = Feature(cosine_of_degrees,[coord])
+    for order in (1,2):
+        suffix = "" if order == 1 else f"_{order}"
+        features[f"sin_doy{suffix}"] = Feature(annual_harmonic,[time_column],order=order,kind="sin")
+        features[f"cos_doy{suffix}"] = Feature(annual_harmonic,[time_column],order=order,kind="cos")
+    return features
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% CACHE %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+MAX_CACHE_BYTES = 256*2**20 # total size of the cached feature arrays
+
+class FeatureCache:
+    '''
+    LRU cache of computed features bounded by the total nbytes of the cached arrays, shared by every
+    pipeline. features are keyed by the identity of their input columns rather than by hashing their
+    contents (which would cost more than computing most features): ColumnarData by its (memoised)
+    fingerprint, other data by the memory address, shape, strides and dtype of each input column. an
+    address only identifies a column while the array owning that memory is alive, so an entry holds
+    weak references to those arrays - without keeping the input data in memory - and is evicted as
+    soon as one of them is freed, before the address can be reused by another array. as for Model,
+    editing a dataframe in place is not detected - call clear_feature_cache afterwards.
+    '''
+    def __init__(self,max_bytes:int=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = collections.OrderedDict() # key -> (feature values, weak references to the input memory)
+
+    @staticmethod
+    def key(data,feature):
+        'returns: the cache key of feature computed from data and the arrays owning the memory of its input columns'
+        if isinstance(data,ColumnarData):
+            return (data.fingerprint(),feature.spec), []
+        columns = [np.asarray(data[label]) for label in feature.inputs]
+        identity = tuple((column.__array_interface__["data"][0],column.shape,column.strides,column.dtype.str)
+                         for column in columns)
+        return (identity,feature.spec), [_owner(column) for column in columns]
+
+    def get(self,data,feature):
+        'returns: the (cached) values of feature for every row of data'
+        key,owners = self.key(data,feature)
+        entry = self._entries.get(key)
+        if entry is not None and all(ref() is owner for ref,owner in zip(entry[1],owners)):
+            self._entries.move_to_end(key)
+            return entry[0]
+        values = feature.compute(data)
+        if values.nbytes <= self.max_bytes:
+            self._evict(key)
+            evict = functools.partial(_evict_entry,weakref.ref(self),key)
+            self._entries[key] = (values,[weakref.ref(owner,evict) for owner in owners])
+            self.nbytes += values.nbytes
+            while self.nbytes > self.max_bytes:
+                evicted,_ = self._entries.popitem(last=False)[1]
+                self.nbytes -= evicted.nbytes
+        return values
+
+    def _evict(self,key):
+        entry = self._entries.pop(key,None)
+        if entry is not None:
+            self.nbytes -= entry[0].nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+def _owner(array):
+    'returns: the array at the root of the views of array, whose lifetime bounds that of the memory'
+    while isinstance(array.base,np.ndarray):
+        array = array.base
+    return array
+
+def _evict_entry(cache_ref,key,_):
+    'weak reference callback: evicts the entry of a freed input array (if the cache still exists)'
+    cache = cache_ref()
+    if cache is not None:
+        cache._evict(key)
+
+##### computed features shared by every pipeline #####
+_features = FeatureCache()
+
+def clear_feature_cache():
+    'discards every cached feature'
+    _features.clear()
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% PIPELINE %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+
+class FeaturePipeline:
+    '''
+    resolves covariate labels against a dataset: labels that are columns of the data are used as they
+    are and the others are computed from their Feature - only the features a model asks for, and each
+    at most once per dataset while it stays in the shared FeatureCache (keyed by the identity of the
+    input columns and the feature spec). pass a pipeline as `feature_pipeline` to LinearRegressionModel or NGBoostModel.
+    '''
+    def __init__(self,features:dict=None,time_column:str="time"):
+        self.features = default_features(time_column) if features is None else dict(features)
+
+    def add(self,label:str,feature:Feature):
+        'registers (or replaces) the feature computed for label'
+        self.features[label] = feature
+
+    def compute(self,data,label:str):
+        'returns: the (cached) values of the derived feature label for every row of data'
+        return _features.get(data,self.features[label])
+
+    def required_columns(self,labels:List[str]):
+        'returns: the columns of the data needed to build the covariates given by labels'
+        columns = []
+        for label in labels:
+            for column in (self.features[label].inputs if label in self.features else [label]):
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    def column(self,data,label:str):
+        'returns: the column label of data if it exists, otherwise the derived feature label'
+        if label in data:
+            return np.asarray(data[label],dtype=float)
+        if label in self.features:
+            return self.compute(data,label)
+        raise KeyError("Covariate(s) were not found in the dataset")
+
+    def covariates(self,data,labels:List[str]):
+        'returns: (N,len(labels)) matrix of the covariates given by labels'
+        if len(labels) == 0:
+            return np.empty((len(data),0))
+        return np.column_stack([self.column(data,label) for label in labels])
+
+    def transform(self,data,labels:List[str]):
+        'returns: a copy of a dataframe with the derived features given by labels added as columns'
+        return data.assign(**{label:self.column(data,label) for label in labels if label not in data})
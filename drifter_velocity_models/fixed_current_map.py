@@ -1,20 +1,114 @@
 # import packages
 import pandas as pd
 import numpy as np
+from data_loader import load_data
+from instrumentation import instrumented, rows_of_argument
 
 # calculate drifter speed from data and add the corresponding column to the data
+def drifter_speed(u_array,v_array):
+    return np.hypot(np.asarray(u_array,dtype=float),np.asarray(v_array,dtype=float))
+
 def new_col_drifter_speed(u_array,v_array,data):
-    drifter_speed = np.array([u**2+v**2 for u,v in zip(u_array,v_array)])
-    data["Drifter Speed"] = drifter_speed
+    data["Drifter Speed"] = drifter_speed(u_array,v_array)
+
+# gridded climatology of drifter velocities
+class CurrentMap:
+    '''
+    gridded current map: drifter observations are binned into lon_size x lat_size degree cells
+    (and, optionally, calendar months) and per-cell statistics are aggregated with np.bincount (the
+    variances in a second pass over the deviations from the cell means). the mean velocities are
+    stored in a flat (num_cells,2) array - with empty cells filled by the overall mean velocity - so
+    that looking a position up is a single array index.
+    '''
+    def __init__(self,lon_size:float=1.,lat_size:float=1.,by_month:bool=False,time_column:str="time"):
+        if lon_size <= 0 or lat_size <= 0:
+            raise ValueError("cell sizes must be positive")
+        self.lon_size = lon_size
+        self.lat_size = lat_size
+        self.by_month = by_month
+        self.time_column = time_column
+        self.num_lon = int(np.ceil(360./lon_size))
+        self.num_lat = int(np.ceil(180./lat_size))
+        self.num_months = 12 if by_month else 1
+        ## per-cell statistics, populated by fit
+        self.count = None # (num_cells,) number of observations
+        self.mean_velocity = None # (num_cells,2) mean [u,v], nan for empty cells
+        self.velocity_variance = None # (num_cells,2) variance of [u,v], nan for empty cells
+        self.mean_speed = None # (num_cells,) mean drifter speed, nan for empty cells
+        self.lookup_velocity = None # (num_cells,2) mean [u,v] with empty cells filled by the overall mean
+
+    @property
+    def num_cells(self):
+        return self.num_months*self.num_lat*self.num_lon
 
+    @property
+    def shape(self):
+        '(months, lat cells, lon cells) - per-cell arrays reshape to shape+(2,) for velocities'
+        return (self.num_months,self.num_lat,self.num_lon)
 
+    def months(self,data):
+        '''returns: zero-based calendar month of every row of data (read from time_column)'''
+        return pd.DatetimeIndex(pd.to_datetime(data[self.time_column])).month.to_numpy()-1
 
+    def cell_index(self,lon,lat,month=None):
+        '''returns: flat cell index of every (lon,lat[,month]) position'''
+        lon_cell = np.floor((np.asarray(lon,dtype=float)+180.)/self.lon_size).astype(np.int64)
+        lat_cell = np.floor((np.asarray(lat,dtype=float)+90.)/self.lat_size).astype(np.int64)
+        index = np.clip(lat_cell,0,self.num_lat-1)*self.num_lon+np.clip(lon_cell,0,self.num_lon-1)
+        if self.by_month:
+            if month is None:
+                raise ValueError("this current map is binned by month, pass the month of every position")
+            index = index+np.asarray(month,dtype=np.int64)*self.num_lat*self.num_lon
+        return index
 
+    @instrumented(rows=rows_of_argument(1))
+    def fit(self,data):
+        '''aggregates the per-cell statistics of the `lon`, `lat`, `u`, `v` (and time) columns of data'''
+        u = np.asarray(data["u"],dtype=float)
+        v = np.asarray(data["v"],dtype=float)
+        if u.shape[0] == 0:
+            raise ValueError("cannot fit a current map to empty data")
+        index = self.cell_index(data["lon"],data["lat"],self.months(data) if self.by_month else None)
+        count = np.bincount(index,minlength=self.num_cells)
+        with np.errstate(invalid="ignore",divide="ignore"):
+            mean_velocity = np.column_stack((np.bincount(index,u,self.num_cells),
+                                             np.bincount(index,v,self.num_cells)))/count[:,np.newaxis]
+            ## second pass over the deviations from the cell means, which unlike E[x^2]-E[x]^2 does
+            ## not cancel catastrophically when the spread of a cell is small next to its mean
+            lookup_mean = mean_velocity[index]
+            velocity_variance = np.column_stack((np.bincount(index,np.square(u-lookup_mean[:,0]),self.num_cells),
+                                                 np.bincount(index,np.square(v-lookup_mean[:,1]),self.num_cells)))/count[:,np.newaxis]
+            self.mean_speed = np.bincount(index,drifter_speed(u,v),self.num_cells)/count
+        self.count = count.astype(np.min_scalar_type(count.max()))
+        self.mean_velocity = mean_velocity
+        self.velocity_variance = velocity_variance
+        self.lookup_velocity = np.where(count[:,np.newaxis] > 0,mean_velocity,np.array([np.mean(u),np.mean(v)]))
+        return self
 
+    def lookup(self,lon,lat,month=None):
+        '''returns: (N,2) array of the mean velocity of the cell containing every position'''
+        if self.lookup_velocity is None:
+            raise AttributeError("the current map has not been fitted. First run `fit(data)`.")
+        return self.lookup_velocity[self.cell_index(lon,lat,month)]
 
+    def to_dataframe(self):
+        '''returns: one row of statistics per non-empty cell, labelled by month and cell centre'''
+        occupied = np.flatnonzero(self.count)
+        month,lat_cell,lon_cell = np.unravel_index(occupied,self.shape)
+        return pd.DataFrame({"month":month+1 if self.by_month else np.zeros_like(month),
+                             "lon":-180.+(lon_cell+0.5)*self.lon_size,
+                             "lat":-90.+(lat_cell+0.5)*self.lat_size,
+                             "count":self.count[occupied],
+                             "u":self.mean_velocity[occupied,0],"v":self.mean_velocity[occupied,1],
+                             "u_variance":self.velocity_variance[occupied,0],
+                             "v_variance":self.velocity_variance[occupied,1],
+                             "speed":self.mean_speed[occupied]})
 
-# load data
-data = pd.read_hdf("ocean_data.h5")
+# load data (lazily, on first access of `data`)
+def __getattr__(name):
+    if name == "data":
+        return load_data()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 # add drifter speed column to data
 
 
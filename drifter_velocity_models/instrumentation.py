@@ -0,0 +1,154 @@
+'description: opt-in timers and counters around the model hot paths, reported to pluggable sinks'
+
+##### import packages #####
+import json
+import time
+import logging
+import functools
+import contextlib
+import pandas as pd
+from typing import List
+
+class _State:
+    enabled = False
+    sinks = []
+
+_state = _State()
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% SINKS %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+
+class MemorySink:
+    '''in-memory registry of every timing event and counter'''
+    def __init__(self):
+        self.events = [] # dicts of name, seconds, rows
+        self.counters = {}
+
+    def record(self,event:dict):
+        self.events.append(event)
+
+    def increment(self,name:str,n:int):
+        self.counters[name] = self.counters.get(name,0)+n
+
+    def summary(self):
+        '''returns: dataframe with one row per timer: calls, total/mean/max seconds, rows and rows/sec'''
+        if not self.events:
+            return pd.DataFrame(columns=["calls","total_seconds","mean_seconds","max_seconds","rows","rows_per_second"])
+        events = pd.DataFrame(self.events)
+        summary = events.groupby("name").agg(calls=("seconds","size"),total_seconds=("seconds","sum"),
+                                             mean_seconds=("seconds","mean"),max_seconds=("seconds","max"),
+                                             rows=("rows","sum"))
+        summary["rows_per_second"] = summary["rows"]/summary["total_seconds"]
+        return summary.sort_values("total_seconds",ascending=False)
+
+    def clear(self):
+        self.events = []
+        self.counters = {}
+
+class LoggingSink:
+    '''writes every event to a logger'''
+    def __init__(self,logger:logging.Logger=None,level:int=logging.DEBUG):
+        self.logger = logger if logger is not None else logging.getLogger("drifter_velocity_models")
+        self.level = level
+
+    def record(self,event:dict):
+        self.logger.log(self.level,"%s: %.6fs rows=%s",event["name"],event["seconds"],event["rows"])
+
+    def increment(self,name:str,n:int):
+        self.logger.log(self.level,"%s += %d",name,n)
+
+class JSONSink(MemorySink):
+    '''keeps events in memory like MemorySink and writes them, with the counters, to a json file on `dump`'''
+    def __init__(self,path:str):
+        super().__init__()
+        self.path = path
+
+    def dump(self):
+        with open(self.path,"w") as file:
+            json.dump({"events":self.events,"counters":self.counters},file,indent=2)
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% CONTROL %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+
+def enable(sinks:List=None):
+    '''turns instrumentation on, reporting to the given sinks (default: a new MemorySink). returns the sinks'''
+    _state.sinks = list(sinks) if sinks is not None else [MemorySink()]
+    _state.enabled = True
+    return _state.sinks
+
+def disable():
+    '''turns instrumentation off (the sinks keep what they have recorded)'''
+    _state.enabled = False
+
+def is_enabled():
+    return _state.enabled
+
+@contextlib.contextmanager
+def profiling(sinks:List=None):
+    '''enables instrumentation for the duration of a with block, yielding the sinks'''
+    previous = (_state.enabled,_state.sinks)
+    try:
+        yield enable(sinks)
+    finally:
+        _state.enabled,_state.sinks = previous
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% RECORDING %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+
+def record(name:str,seconds:float,rows:int=None):
+    'sends a timing event to every sink (when enabled)'
+    if _state.enabled:
+        event = {"name":name,"seconds":seconds,"rows":rows,"timestamp":time.time()}
+        for sink in _state.sinks:
+            sink.record(event)
+
+def increment(name:str,n:int=1):
+    'adds n to a counter in every sink (when enabled)'
+    if _state.enabled:
+        for sink in _state.sinks:
+            sink.increment(name,n)
+
+@contextlib.contextmanager
+def timer(name:str,rows:int=None):
+    '''times the body of a with block (when enabled)'''
+    if not _state.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name,time.perf_counter()-start,rows)
+
+def instrumented(name:str=None,rows=None):
+    '''
+    decorator timing every call of a function when instrumentation is enabled. when disabled the
+    only overhead is a single flag check.
+
+    params:
+    [str] name: timer name (default: the function's qualified name)
+    rows: function of (args, kwargs, result) returning the number of rows the call processed
+    '''
+    def decorator(func):
+        timer_name = name if name is not None else func.__qualname__
+        @functools.wraps(func)
+        def wrapper(*args,**kwargs):
+            if not _state.enabled:
+                return func(*args,**kwargs)
+            start = time.perf_counter()
+            result = func(*args,**kwargs)
+            seconds = time.perf_counter()-start
+            record(timer_name,seconds,rows(args,kwargs,result) if rows is not None else None)
+            return result
+        return wrapper
+    return decorator
+
+##### row counters for instrumented #####
+def rows_of_argument(position:int):
+    'rows: the length of the positional argument at position'
+    return lambda args,kwargs,result: len(args[position])
+
+def rows_of_attribute(name:str):
+    'rows: the length of an attribute of the first argument (e.g. a method\'s self.training_data)'
+    return lambda args,kwargs,result: len(getattr(args[0],name))
+
+def rows_of_result(args,kwargs,result):
+    'rows: the length of the result'
+    return len(result)
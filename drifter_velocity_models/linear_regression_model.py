@@ -1,13 +1,16 @@
 from model_classes import Model
+from data_loader import DEFAULT_PATH, iter_data
+from instrumentation import instrumented, rows_of_argument, rows_of_attribute
 #import packages
 import numpy as np
 from numpy import linalg
 
 class LinearRegressionModel(Model):
     
-    def __init__(self,loss_type:str,uncertainty_type:str,training_data,test_data,covariate_labels):
+    def __init__(self,loss_type:str,uncertainty_type:str,training_data,test_data,covariate_labels,feature_pipeline=None):
         super().__init__(loss_type,uncertainty_type,training_data,test_data)
         self.model_type = "lr"
+        self.feature_pipeline = feature_pipeline # optional FeaturePipeline deriving covariates that are not columns
         self.covariate_labels = covariate_labels
         self.param_estimate = None
     #------------------------ model constructions -------------------------#
@@ -23,20 +26,102 @@ class LinearRegressionModel(Model):
     #============== estimate parameter (vector) beta ==================#
     @property
     def design(self):
-        '''returns the design matrix associated with the training data'''
+        '''returns the (memoised) design matrix associated with the training data'''
+        return self._cached(("design","train"),lambda: self.covariates(self.training_data))
+
+    @property
+    def test_design(self):
+        '''returns the (memoised) matrix of covariates associated with the test data'''
+        return self._cached(("design","test"),lambda: self.covariates(self.test_data))
+
+    def covariates(self,data):
+        '''returns the matrix of covariates in data given by covariate_labels (derived by feature_pipeline if given)'''
+        if self.feature_pipeline is not None:
+            return self.feature_pipeline.covariates(data,self.covariate_labels)
         try:
-            design_matrix = np.array(self.training_data.loc[:,self.covariate_labels])
-            return design_matrix
-        except:
+            return self.extract_columns(data,self.covariate_labels)
+        except KeyError:
             raise KeyError("Covariate(s) were not found in the dataset")
     
+    @instrumented(rows=rows_of_attribute("training_data"))
     def calculate_param_estimate(self):
         '''returns least squares parameter estimate'''
         lstsq_estimate = linalg.lstsq(self.design,
-                                       np.array(self.training_data.loc[:,["u","v"]]),
+                                       self.observations("train"),
                                        rcond=None)
         self.param_estimate= lstsq_estimate[0]
 
+    #============== incremental estimation from sufficient statistics ==================#
+    @instrumented(rows=rows_of_argument(1))
+    def partial_fit(self,data,forgetting_factor:float=1.):
+        '''
+        updates the running sufficient statistics xtx = XᵀX and xty = XᵀY with a batch of data and
+        re-solves the normal equations for param_estimate. fitting the batches of a dataset one after
+        another gives the same estimate as calculate_param_estimate on the whole dataset.
+
+        params:
+        [DataFrame] data: batch of data holding the covariates and `u`, `v`
+        [float] forgetting_factor: in (0,1]; the statistics accumulated so far are scaled by this factor
+                                   before the batch is added, so older batches are exponentially down-weighted
+        '''
+        if not 0 < forgetting_factor <= 1:
+            raise ValueError("forgetting factor must be in (0,1]")
+        X = self.covariates(data)
+        Y = self.extract_columns(data,["u","v"])
+        if self.xtx is None:
+            self.xtx = np.zeros((X.shape[1],X.shape[1]))
+            self.xty = np.zeros((X.shape[1],Y.shape[1]))
+        self.xtx = forgetting_factor*self.xtx+np.matmul(X.T,X)
+        self.xty = forgetting_factor*self.xty+np.matmul(X.T,Y)
+        self.num_fitted += X.shape[0]
+        self.param_estimate = linalg.lstsq(self.xtx,self.xty,rcond=None)[0]
+
+    def partial_fit_hdf(self,path:str=DEFAULT_PATH,key:str=None,chunksize:int=100_000,forgetting_factor:float=1.):
+        '''partial_fit every chunk of the hdf5 store at path in turn (forgetting_factor is applied per chunk)'''
+        columns = list(self.covariate_labels) if self.feature_pipeline is None else \
+                  self.feature_pipeline.required_columns(self.covariate_labels)
+        for chunk in iter_data(path,key=key,chunksize=chunksize,columns=columns+[label for label in ("u","v") if label not in columns]):
+            self.partial_fit(chunk,forgetting_factor)
+
+    def reset_fit(self):
+        '''discards param_estimate (the sufficient statistics of partial_fit are kept)'''
+        self.param_estimate = None
+
+    def reset_sufficient_statistics(self):
+        '''discards the statistics accumulated by partial_fit'''
+        self.xtx = None
+        self.xty = None
+        self.num_fitted = 0
+
+    #-------------------------- properties and setters --------------------------#
+    @property
+    def covariate_labels(self):
+        return self._covariate_labels
+
+    @covariate_labels.setter
+    def covariate_labels(self,labels):
+        self._covariate_labels = labels
+        self.reset_sufficient_statistics()
+        self.clear_cache()
+
+    @property
+    def feature_pipeline(self):
+        return self._feature_pipeline
+
+    @feature_pipeline.setter
+    def feature_pipeline(self,pipeline):
+        self._feature_pipeline = pipeline
+        self.clear_cache()
+
+    @property
+    def param_estimate(self):
+        return self._param_estimate
+
+    @param_estimate.setter
+    def param_estimate(self,val):
+        self._param_estimate = val
+        self.clear_predictions()
+
     #----------------------- 'immutable' properties -----------------------#
     @property
     def model_function(self):
@@ -47,16 +132,34 @@ class LinearRegressionModel(Model):
         ' return prediction for each vector of covariates for seen data'
         if self.param_estimate is None:
             self.calculate_param_estimate()
-        pred = self.model_function(self.design,
-                                   self.param_estimate)
-        return pred
+        return self._cached(("prediction","train"),
+                            lambda: self.model_function(self.design,self.param_estimate))
     
     @property
     def testing_prediction(self):
         'return prediction for each vector of covariates in test data'
         if self.param_estimate is None:
             self.calculate_param_estimate()
-        pred = self.model_function(np.array(self.test_data.loc[:,self.covariate_labels]),
-                                   self.param_estimate)
-        return pred
-    
\ No newline at end of file
+        return self._cached(("prediction","test"),
+                            lambda: self.model_function(self.test_design,self.param_estimate))
+
+    #----------------------- predictions -----------------------#
+    @instrumented(rows=rows_of_argument(1))
+    def predict(self,data):
+        if self.param_estimate is None:
+            self.calculate_param_estimate()
+        return self.model_function(self.covariates(data),self.param_estimate)
+
+    #----------------------- persistence -----------------------#
+    def artifact_state(self):
+        if self.param_estimate is None:
+            self.calculate_param_estimate()
+        arrays = {"param_estimate":np.asarray(self.param_estimate)}
+        if self.xtx is not None:
+            arrays.update({"xtx":self.xtx,"xty":self.xty})
+        objects = {"feature_pipeline":self.feature_pipeline} if self.feature_pipeline is not None else {}
+        return arrays, {"covariate_labels":list(self.covariate_labels),"num_fitted":int(self.num_fitted)}, objects
+
+    def restore_artifact_state(self,arrays,attributes,objects):
+        self.feature_pipeline = None
+        super().restore_artifact_state(arrays,attributes,objects)
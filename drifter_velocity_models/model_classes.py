@@ -2,22 +2,31 @@
 
 #%%%%%%%%%%%%%%%%%%%%%%%%%%%% SET UP %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
 ##### import packages #####
+import abc
 import numpy as np
-from numpy import linalg
 import pandas as pd
 import math
 from typing import List
+from data_loader import load_data
+from columnar_data import ColumnarData
+from instrumentation import instrumented, increment, is_enabled, rows_of_argument, rows_of_result
 
 
 ##### load data #####
-data = pd.read_hdf("ocean_data.h5")
+def __getattr__(name):
+    '''`data` is loaded lazily on first access (see data_loader.load_data) rather than at import'''
+    if name == "data":
+        return load_data()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-class Model:
+class Model(abc.ABC):
     '''
     this class will be the parent class of all ocean models that we will be using
     and it will define attributes and methods common to all specific model classes.
     '''
     def __init__(self, loss_type:str,uncertainty_type:str,training_data:List[float],test_data:List[float]):
+        ## memoised observations, design matrices, predictions and losses
+        self._cache = {}
         ## model specifiers
         self.loss_type = loss_type # specify loss function
         self.uncertainty_type = uncertainty_type
@@ -67,31 +76,20 @@ class Model:
         [array] obs: array of observations
         [array] preds: array of predictions
         '''
-        squared_residuals = np.square(__class__.residuals(obs,preds))
-        return __class__.to_cm_per_second(np.sqrt(np.mean(squared_residuals)))
+        return __class__.residual_statistics(obs,preds,keys=["rmse"])["rmse"]
     
     @staticmethod
     def rms_residual_speed_and_direction(obs:List[float],preds:List[float]):
         '''
-        returns: Returns the root mean square (rms) of the speed and rms of the direction of the velocity residuals
+        returns: Returns the root mean square (rms) of the speed and rms of the direction of the velocity residuals.
+                 directions are measured with arctan2, so they keep their quadrant and a zero residual has direction 0.
 
         params:
         [array] obs: array of observations
         [array] preds: array of predictions
         '''
-        if obs.shape[1] != 2:
-            raise ValueError("Residual Velocities must be of the form [u,v]")
-        else:
-            velocity_residuals = __class__.residuals(obs,preds)
-            rms_residual_speed = np.sqrt(np.mean(\
-                                         np.square(\
-                                             linalg.norm(velocity_residuals,axis=1))))
-            residual_direction = np.arctan(np.divide(velocity_residuals[:,1],velocity_residuals[:,0]))
-            rms_residual_direction = np.sqrt(np.mean(\
-                                            np.square(\
-                                                residual_direction)))
-
-        return __class__.to_cm_per_second(rms_residual_speed), __class__.to_degrees(rms_residual_direction)
+        statistics = __class__.residual_statistics(obs,preds,keys=["rms_speed","rms_direction"])
+        return statistics["rms_speed"], statistics["rms_direction"]
     
     @staticmethod
     def standard_error_of_residuals(obs:List[float],preds:list[float]):
@@ -102,47 +100,103 @@ class Model:
         [array] obs: array of observations
         [array] preds: array of predictions
         '''
-        return __class__.to_cm_per_second(np.std(__class__.residuals(obs,preds)))
+        return __class__.residual_statistics(obs,preds,keys=["sre"])["sre"]
     
     @staticmethod
     def std_residual_speed_and_direction(obs:List[float],preds:List[float]):
         '''
-        returns: returns the standard deviation of the residual speed and residual direction
+        returns: returns the standard deviation of the residual speed and the circular standard deviation
+                 of the residual direction
         
         params: 
         [array] obs: array of velocity observations
         [array] preds: array of velocity predictions
         '''
-        if obs.shape[1] != 2:
-            raise ValueError("Residual Velocities must be of the form [u,v]")
-        else:
-            velocity_residuals = __class__.residuals(obs,preds)
-            speed_residuals = linalg.norm(velocity_residuals,axis=1)
-            direction_residuals = np.arctan(\
-                                        np.divide(velocity_residuals[:,1],velocity_residuals[:,0]))
-            return __class__.to_cm_per_second(np.std(speed_residuals)),\
-                  __class__.to_degrees(np.std(direction_residuals))
+        statistics = __class__.residual_statistics(obs,preds,keys=["std_speed","std_direction"])
+        return statistics["std_speed"], statistics["std_direction"]
+
+    @staticmethod
+    @instrumented("residual_statistics",rows=rows_of_argument(0))
+    def residual_statistics(obs:List[float],preds:List[float],chunk_size:int=65536,keys:List[str]=None):
+        '''
+        returns: dict of the residual statistics given by keys (default: all of them) - `rmse`, `sre`,
+                 `rms_speed`, `std_speed` (cm/s) and `rms_direction`, `std_direction`, `mean_direction` (degrees) -
+                 computed together in a single chunked pass (see ResidualStatistics)
+
+        params:
+        [array] obs: array of velocity observations
+        [array] preds: array of velocity predictions
+        [int] chunk_size: rows per chunk
+        [list] keys: statistics to compute - the pass skips the speeds and directions that none of them need
+        '''
+        return ResidualStatistics(chunk_size,keys).update(obs,preds).statistics()
+
+    @staticmethod
+    def required_statistics(types:List[str]):
+        'returns: the residual_statistics keys behind the given loss/uncertainty types'
+        keys = []
+        for name in types:
+            key = __class__.statistic_keys[name]
+            keys += [key] if isinstance(key,str) else list(key)
+        return keys
        
     #=== loss class variables ===#
 
-    loss_functions = {'rmse':rmse, 'rms_s_d':rms_residual_speed_and_direction}
-    uncertainty_functions = {'sre':standard_error_of_residuals, 'sr_s_d':std_residual_speed_and_direction}
+    loss_functions = {'rmse':instrumented('loss_function.rmse',rows_of_argument(0))(rmse),
+                      'rms_s_d':instrumented('loss_function.rms_s_d',rows_of_argument(0))(rms_residual_speed_and_direction)}
+    uncertainty_functions = {'sre':instrumented('uncertainty_function.sre',rows_of_argument(0))(standard_error_of_residuals),
+                             'sr_s_d':instrumented('uncertainty_function.sr_s_d',rows_of_argument(0))(std_residual_speed_and_direction)}
+    ## the residual_statistics behind each loss/uncertainty type
+    statistic_keys = {'rmse':'rmse', 'rms_s_d':('rms_speed','rms_direction'),
+                      'sre':'sre', 'sr_s_d':('std_speed','std_direction')}
     
     # -------------------- validation -------------------- #
 
     @staticmethod
     def check_coordinates(lon:float,lat:float):
+        '''validates a single (lon,lat) position - thin wrapper over `check_coordinates_batch`'''
+        __class__.check_coordinates_batch([lon],[lat])
+
+    @staticmethod
+    @instrumented("validation",rows=lambda args,kwargs,result: len(result[0]))
+    def check_coordinates_batch(lon:List[float],lat:List[float]):
+        '''
+        returns: lon and lat as flat float arrays, after validating every position in a single vectorised pass
+
+        params:
+        [array] lon: array of longitudes
+        [array] lat: array of latitudes
+        '''
         limits = {"lat":90.,"lon":180.}
         values = {"lat":lat,"lon":lon}
 
         for coord in values.keys():
             try:
-                float(values[coord])
-            except:
+                values[coord] = np.asarray(values[coord],dtype=float).reshape(-1)
+            except (TypeError,ValueError):
                 raise ValueError(f"{coord} must be a real number")
-            finally:
-                if np.abs(values[coord])>limits[coord]:
-                    raise ValueError(f"{coord} must be between -{limits[coord]} and {limits[coord]}")
+            if np.any(np.abs(values[coord])>limits[coord]):
+                raise ValueError(f"{coord} must be between -{limits[coord]} and {limits[coord]}")
+        if values["lon"].shape != values["lat"].shape:
+            raise ValueError("lon and lat must contain the same number of positions")
+        return values["lon"], values["lat"]
+
+    @staticmethod
+    @instrumented("extract_coordinates",rows=lambda args,kwargs,result: len(result[0]))
+    def coordinates(data):
+        '''returns: the lon and lat columns of data as arrays'''
+        return np.asarray(data["lon"]), np.asarray(data["lat"])
+
+    @staticmethod
+    @instrumented("extract_columns",rows=rows_of_result)
+    def extract_columns(data,labels:List[str]):
+        '''returns: the columns of data given by labels as an (N,len(labels)) array (a view for ColumnarData)'''
+        if isinstance(data,ColumnarData):
+            return data.columns_array(labels)
+        try:
+            return np.array(data.loc[:,labels])
+        except KeyError:
+            raise KeyError(f"column(s) {labels} were not found in the dataset")
 
     #++++++++++++++++++++++ MODEL PROPERTIES AND SETTERS +++++++++++++++++++++#
     # -------------------- properties ---------------------#
@@ -196,24 +250,238 @@ class Model:
     
     @training_data.setter
     def training_data(self,data_subset):
-        'changes the value of the training_data property'
+        'changes the value of the training_data property, discarding everything fitted to the old data'
         self._training_data = data_subset
+        self.clear_cache()
+        self.reset_fit()
 
     @test_data.setter
     def test_data(self,data_subset):
         'changes the value of the test_data property'
         self._test_data = data_subset
+        self.clear_cache("test")
 
     #++++++++++++++++++++++ INSTANCE METHODS ++++++++++++++++++++++++++#
 
-    def loss(self,test_or_train):
-        'calculate and return training loss'
+    # ---------------------- cache ----------------------- #
+    def _cached(self,key:tuple,compute):
+        '''
+        returns the value memoised under key, calling compute() to populate it on first use.
+        keys are tuples of the form (kind, "train"/"test", ...).
+        '''
+        if key not in self._cache:
+            increment(f"cache_miss.{key[0]}")
+            self._cache[key] = compute()
+        else:
+            increment(f"cache_hit.{key[0]}")
+        return self._cache[key]
+
+    def clear_cache(self,test_or_train:str=None):
+        '''
+        discards memoised values - for one data subset (`train` or `test`) if given, otherwise all of them.
+        called by the setters of anything a cached value depends on. in-place edits of the
+        dataframes are not detected, so call this explicitly after mutating them.
+        '''
+        if test_or_train is None:
+            self._cache.clear()
+        else:
+            for key in [key for key in self._cache if key[1] == test_or_train]:
+                del self._cache[key]
+
+    def reset_fit(self):
+        '''
+        discards the fitted state, so that the model is refitted to training_data on its next prediction.
+        called by the training_data setter; overridden by every sub-type with fitted parameters.
+        '''
+
+    def clear_predictions(self):
+        'discards memoised predictions and losses, keeping observations and design matrices'
+        for key in [key for key in self._cache if key[0] in ("prediction","loss")]:
+            del self._cache[key]
+
+    def data_subset(self,test_or_train:str):
+        'returns training_data or test_data according to test_or_train'
+        if test_or_train == "train":
+            return self.training_data
+        elif test_or_train == "test":
+            return self.test_data
+        else:
+            raise ValueError("Invalid data subset, pass either `test` or `train`")
+
+    def observations(self,test_or_train:str):
+        'returns the (memoised) array of observed velocities [u,v] for the test or train data'
+        return self._cached(("observations",test_or_train),
+                            lambda: self.extract_columns(self.data_subset(test_or_train),["u","v"]))
+
+    def prediction(self,test_or_train:str):
+        'returns trained_prediction or testing_prediction according to test_or_train'
         if test_or_train == "train":
-            obs = np.array(self.training_data[["u","v"]])
-            preds = self.trained_prediction
+            return self.trained_prediction
         elif test_or_train == "test":
-            obs = np.array(self.test_data[["u","v"]])
-            preds = self.testing_prediction
+            return self.testing_prediction
         else:
             raise ValueError("Invalid data subset, pass either `test` or `train`")
-        return self.loss_function(obs,preds), self.uncertainty_function(obs,preds)
+
+    def spatial_index(self,test_or_train:str="train"):
+        'returns the (memoised) SpatialIndex over the lon/lat positions of the test or train data'
+        from spatial_index import SpatialIndex # scipy is only imported when an index is requested
+        return self._cached(("spatial_index",test_or_train),
+                            lambda: SpatialIndex(self.data_subset(test_or_train)))
+
+    @abc.abstractmethod
+    def predict(self,data):
+        '''
+        returns: (N,2) array of velocity predictions, one [u,v] row per row of data
+
+        params:
+        [DataFrame] data: positions (and covariates) at which to predict
+        '''
+
+    @instrumented("Model.loss",rows=lambda args,kwargs,result: len(args[0].data_subset(args[1])))
+    def loss(self,test_or_train):
+        'calculate and return training loss (memoised per loss and uncertainty type)'
+        if test_or_train not in ("train","test"):
+            raise ValueError("Invalid data subset, pass either `test` or `train`")
+        return self._cached(("loss",test_or_train,self.loss_type,self.uncertainty_type),
+                            lambda: self._evaluate_loss(test_or_train))
+
+    def _evaluate_loss(self,test_or_train):
+        obs = self.observations(test_or_train)
+        preds = self.prediction(test_or_train)
+        types = (self.loss_type,self.uncertainty_type)
+        # loss/uncertainty functions added by a sub-type, or instrumented runs - which time the loss and the
+        # uncertainty separately, in a pass each (the results are identical to those of the shared pass)
+        if is_enabled() or any(name not in self.statistic_keys for name in types):
+            return self.loss_function(obs,preds), self.uncertainty_function(obs,preds)
+        # one pass over the residuals gives both the loss and the uncertainty
+        statistics = self.residual_statistics(obs,preds,keys=self.required_statistics(types))
+        keys = [self.statistic_keys[name] for name in types]
+        return tuple(statistics[key] if isinstance(key,str) else tuple(statistics[k] for k in key) for key in keys)
+
+    def loss_with_intervals(self,test_or_train,num_replicates:int=1000,confidence:float=0.95,groups=None,random_state=None):
+        '''
+        returns: (loss, uncertainty, intervals) - the output of `loss` and a dataframe of bootstrap confidence
+                 intervals of both (see bootstrap.bootstrap_loss). groups: e.g. `id` to resample whole drifters
+        '''
+        from bootstrap import bootstrap_loss
+        intervals = bootstrap_loss(self,test_or_train,num_replicates=num_replicates,confidence=confidence,
+                                   groups=groups,random_state=random_state)
+        return (*self.loss(test_or_train), intervals)
+
+    # -------------------- persistence -------------------- #
+    def artifact_state(self):
+        '''
+        returns: (arrays, attributes, objects) - the fitted state saved by model_store.save_model, as dicts of
+                 numpy arrays (saved memory-mappable), json-serialisable attributes and other (pickled) objects.
+                 overridden by every sub-type with fitted parameters.
+        '''
+        return {}, {}, {}
+
+    def restore_artifact_state(self,arrays:dict,attributes:dict,objects:dict):
+        'restores the state returned by artifact_state (attributes first, then arrays, then objects)'
+        for name,value in {**attributes,**arrays,**objects}.items():
+            setattr(self,name,value)
+
+class ResidualStatistics:
+    '''
+    fused kernel for the velocity residual statistics. batches of observations and predictions are
+    processed in chunks through preallocated buffers: each chunk's residuals (and, only when a requested
+    statistic needs them, speeds and arctan2 directions) are computed once and reduced to sums and sums of
+    squares, from which the chunk means and second central moments are merged across chunks and batches
+    with the parallel form of Welford's algorithm (Chan et al.). the second moment of a chunk is summed
+    over the deviations from the chunk mean (a second pass over the chunk in the scratch buffer), as
+    E[x^2]-E[x]^2 loses all precision when the spread of the residuals is small next to their mean. directions are summarised with circular
+    statistics: the mean direction is the direction of the mean unit vector and the circular standard
+    deviation is sqrt(-2 ln R), R being the length of the mean unit vector.
+    '''
+    statistic_names = ("rmse","sre","rms_speed","std_speed","rms_direction","std_direction","mean_direction")
+
+    def __init__(self,chunk_size:int=65536,keys:List[str]=None):
+        '''
+        params:
+        [int] chunk_size: rows per chunk
+        [list] keys: statistics to accumulate (default: all of statistic_names)
+        '''
+        keys = self.statistic_names if keys is None else keys
+        unknown = [key for key in keys if key not in self.statistic_names]
+        if unknown:
+            raise ValueError(f"unknown residual statistic(s) {unknown}")
+        self.chunk_size = chunk_size
+        self.angles = "rms_direction" in keys # arctan2 of the residuals, the most expensive part of the pass
+        self.unit_vectors = "std_direction" in keys or "mean_direction" in keys
+        self.speeds = self.unit_vectors or "rms_speed" in keys or "std_speed" in keys
+        self.count = 0 # number of (u,v) residuals
+        self.components = [0.,0.,0.] # mean, M2 and sum of squares of the pooled u and v residuals
+        self.speed = [0.,0.,0.] # mean, M2 and sum of squares of the residual speeds
+        self.direction_sum_of_squares = 0.
+        self.unit_sum = np.zeros(2) # sum of the unit vectors in the residual directions
+        self._buffers = None
+
+    @staticmethod
+    def _merge(moments,count,values,scratch):
+        '''merges a (contiguous) chunk of values into [mean, M2, sum of squares] of count previous values.
+           scratch: flat buffer of at least values.size elements, overwritten with the deviations'''
+        n = values.size
+        chunk_mean = np.sum(values)/n
+        deviations = np.subtract(values,chunk_mean,out=scratch[:n].reshape(values.shape))
+        delta = chunk_mean-moments[0]
+        moments[0] += delta*n/(count+n)
+        moments[1] += np.vdot(deviations,deviations)+delta*delta*count*n/(count+n)
+        moments[2] += np.vdot(values,values)
+
+    def update(self,obs:List[float],preds:List[float]):
+        'merges a batch of observations and predictions into the statistics and returns self'
+        obs = np.asarray(obs)
+        if obs.ndim != 2 or obs.shape[1] != 2:
+            raise ValueError("Residual Velocities must be of the form [u,v]")
+        preds = np.broadcast_to(np.asarray(preds),obs.shape)
+        num_rows = obs.shape[0]
+        if self._buffers is None or self._buffers[0].shape[0] < min(self.chunk_size,num_rows):
+            size = max(min(self.chunk_size,num_rows),1)
+            self._buffers = (np.empty((size,2)),np.empty(size),np.empty(2*size))
+        for start in range(0,num_rows,self.chunk_size):
+            stop = min(start+self.chunk_size,num_rows)
+            n = stop-start
+            residuals,speed = self._buffers[0][:n],self._buffers[1][:n]
+            deviations,scratch = self._buffers[2],self._buffers[2][:n]
+            np.subtract(obs[start:stop],preds[start:stop],out=residuals)
+            self._merge(self.components,2*self.count,residuals,deviations)
+            if self.speeds:
+                np.hypot(residuals[:,0],residuals[:,1],out=speed)
+                self._merge(self.speed,self.count,speed,deviations)
+            if self.angles:
+                np.arctan2(residuals[:,1],residuals[:,0],out=scratch)
+                self.direction_sum_of_squares += np.vdot(scratch,scratch)
+            if self.unit_vectors:
+                # sum of residual/speed in one matrix-vector product; zero residuals contribute nothing
+                # there and are counted as direction 0 (unit vector [1,0]), as arctan2
+                np.maximum(speed,np.finfo(float).tiny,out=scratch)
+                np.divide(1.,scratch,out=scratch)
+                self.unit_sum += np.dot(scratch,residuals)
+                self.unit_sum[0] += n-np.count_nonzero(speed)
+            self.count += n
+        return self
+
+    def statistics(self):
+        'returns: dict of the accumulated residual statistics (speeds and velocities in cm/s, directions in degrees)'
+        if self.count == 0:
+            raise ValueError("no residuals have been accumulated")
+        statistics = {"rmse":Model.to_cm_per_second(np.sqrt(self.components[2]/(2*self.count))),
+                      "sre":Model.to_cm_per_second(np.sqrt(self.components[1]/(2*self.count)))}
+        if self.speeds:
+            statistics["rms_speed"] = Model.to_cm_per_second(np.sqrt(self.speed[2]/self.count))
+            statistics["std_speed"] = Model.to_cm_per_second(np.sqrt(self.speed[1]/self.count))
+        if self.angles:
+            statistics["rms_direction"] = Model.to_degrees(np.sqrt(self.direction_sum_of_squares/self.count))
+        if self.unit_vectors:
+            mean_resultant = np.hypot(*self.unit_sum)/self.count
+            statistics["std_direction"] = Model.to_degrees(np.sqrt(-2*np.log(np.clip(mean_resultant,1e-300,1.))))
+            statistics["mean_direction"] = Model.to_degrees(np.arctan2(self.unit_sum[1],self.unit_sum[0]))
+        return statistics
+
+    def results(self):
+        'returns: dict of the value of every loss and uncertainty function whose statistics were accumulated'
+        statistics = self.statistics()
+        return {name:statistics[key] if isinstance(key,str) else tuple(statistics[k] for k in key)
+                for name,key in Model.statistic_keys.items()
+                if all(k in statistics for k in ([key] if isinstance(key,str) else key))}
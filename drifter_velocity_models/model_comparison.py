@@ -0,0 +1,121 @@
+'description: fitting and scoring several models concurrently against the same train/test split'
+
+##### import packages #####
+import itertools
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List
+from model_classes import Model
+from columnar_data import ColumnarData
+from model_selection import SharedFrame, build_model, attach_worker, worker_frame
+from benchmark_models import BathtubModel, SBRModel, FixedCurrentModel
+from linear_regression_model import LinearRegressionModel
+try:
+    from ng_boost_model import NGBoostModel
+except ImportError: # ngboost is only needed for the probabilistic model
+    NGBoostModel = None
+
+def default_models(covariate_labels:List[str]=None,num_estimators:int=100):
+    '''
+    returns: dict of model name -> (model class, constructor parameters) for the benchmark models and,
+             when covariate_labels are given, the linear regression and NGBoost models
+    '''
+    models = {"bathtub":(BathtubModel,{}),
+              "sbr":(SBRModel,{}),
+              "fixedcurrent":(FixedCurrentModel,{})}
+    if covariate_labels:
+        models["lr"] = (LinearRegressionModel,{"covariate_labels":list(covariate_labels)})
+        if NGBoostModel is not None:
+            models["ngboost_pr"] = (NGBoostModel,{"covariate_labels":list(covariate_labels),
+                                                  "num_estimators":num_estimators})
+    return models
+
+def shared_view(data,columns:List[str]=None):
+    '''
+    returns: read-only float64 ColumnarData holding the given (by default all) columns of data, extracted
+             once so that every model reads its observations and covariates as views of the same block
+    '''
+    if isinstance(data,ColumnarData):
+        return data
+    return ColumnarData.from_dataframe(data,columns,dtype=np.float64)
+
+def score_model(name:str,model_class,params:dict,training_data,test_data,
+                loss_types:List[str],uncertainty_types:List[str]):
+    '''
+    returns: list of rows - the train and test loss of one model for every (loss_type, uncertainty_type).
+             the model is fitted and predicts once; every loss reuses its memoised observations and predictions.
+    '''
+    start = time.perf_counter()
+    model = build_model(model_class,loss_types[0],uncertainty_types[0],training_data,test_data,params)
+    for subset in ("train","test"):
+        model.prediction(subset) # fits the model on first use
+    fit_seconds = time.perf_counter()-start
+    rows = []
+    for subset in ("train","test"):
+        for loss_type,uncertainty_type in itertools.product(loss_types,uncertainty_types):
+            model.loss_type = loss_type
+            model.uncertainty_type = uncertainty_type
+            loss,uncertainty = model.loss(subset)
+            rows.append({"model":name,"subset":subset,"loss_type":loss_type,"uncertainty_type":uncertainty_type,
+                         "loss":loss,"uncertainty":uncertainty})
+    seconds = time.perf_counter()-start
+    return [{**row,"fit_seconds":fit_seconds,"seconds":seconds} for row in rows]
+
+def _score_shared(name,model_class,params,num_training_rows,loss_types,uncertainty_types):
+    data = worker_frame()
+    return score_model(name,model_class,params,data.iloc[:num_training_rows],data.iloc[num_training_rows:],
+                       loss_types,uncertainty_types)
+
+def compare_models(training_data,test_data,models:dict=None,loss_types:List[str]=None,
+                   uncertainty_types:List[str]=None,columns:List[str]=None,executor:str="thread",
+                   max_workers:int=None):
+    '''
+    returns: tidy dataframe with one row per (model, subset, loss_type, uncertainty_type) holding the
+             `Model.loss` output, plus each model's fit and total seconds. the wall time of the whole
+             comparison is stored in `attrs["wall_seconds"]`.
+
+    params:
+    [DataFrame] training_data, test_data: the split every model is fitted and scored on
+    [dict] models: model name -> (model class, constructor parameters), defaults to default_models()
+    [list] loss_types, uncertainty_types: types to report (default: every entry of Model.loss_functions
+                                          and Model.uncertainty_functions)
+    [list] columns: columns to share with the models (default: all)
+    [str] executor: `thread` - models share one read-only float64 ColumnarData of each subset. suits
+                    the numpy-bound models, which release the GIL in their array operations.
+                    `process` - the data is copied once into shared memory that every worker attaches
+                    to (non-numeric columns are pickled once per worker). suits python-bound fits such as NGBoostModel.
+    [int] max_workers: pool size (default: one worker per model)
+    '''
+    if models is None:
+        models = default_models()
+    if loss_types is None:
+        loss_types = list(Model.loss_functions)
+    if uncertainty_types is None:
+        uncertainty_types = list(Model.uncertainty_functions)
+    if executor not in ("thread","process"):
+        raise ValueError("executor must be either `thread` or `process`")
+    max_workers = max_workers if max_workers is not None else max(len(models),1)
+    start = time.perf_counter()
+    rows = []
+    if executor == "thread":
+        training_view,test_view = shared_view(training_data,columns),shared_view(test_data,columns)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(score_model,name,model_class,params,training_view,test_view,loss_types,uncertainty_types)
+                       for name,(model_class,params) in models.items()]
+            for future in futures:
+                rows += future.result()
+    else:
+        if isinstance(training_data,ColumnarData):
+            training_data,test_data = training_data.to_dataframe(),test_data.to_dataframe()
+        data = pd.concat([training_data,test_data],ignore_index=True)
+        with SharedFrame(data,columns) as shared:
+            with ProcessPoolExecutor(max_workers=max_workers,initializer=attach_worker,initargs=(shared.spec,)) as pool:
+                futures = [pool.submit(_score_shared,name,model_class,params,len(training_data),loss_types,uncertainty_types)
+                           for name,(model_class,params) in models.items()]
+                for future in futures:
+                    rows += future.result()
+    comparison = pd.DataFrame(rows)
+    comparison.attrs["wall_seconds"] = time.perf_counter()-start
+    return comparison
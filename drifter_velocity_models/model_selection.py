@@ -0,0 +1,174 @@
+'description: parallel cross-validation and hyperparameter sweeps over Model subclasses'
+
+##### import packages #####
+import inspect
+import itertools
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+from typing import List
+from splitters import KFoldSplitter
+from columnar_data import ColumnarData
+
+class SharedFrame:
+    '''
+    numeric columns of a dataframe (or of the block of a ColumnarData) copied once into a block of
+    shared memory, so that worker processes can attach to the data by name instead of receiving a
+    pickled copy per task. non-numeric columns (e.g. a datetime `time` column) cannot live in the
+    float64 block and are shipped alongside in the spec, i.e. pickled once per worker. use as a
+    context manager (or call `close`) to release the block.
+    '''
+    def __init__(self,data,columns:List[str]=None):
+        if columns is None:
+            columns = list(data.columns)
+        if isinstance(data,ColumnarData):
+            numeric = [label for label in columns if label in data.column_index]
+            values = data.columns_array(numeric)
+            other = {label:data.other[label] for label in columns if label not in numeric}
+        else:
+            numeric = [label for label in columns if pd.api.types.is_numeric_dtype(data[label])]
+            values = data.loc[:,numeric].to_numpy(dtype=float)
+            other = {label:data[label].array for label in columns if label not in numeric}
+        shape = (len(data),len(numeric))
+        self._shm = shared_memory.SharedMemory(create=True,size=max(8*shape[0]*shape[1],1))
+        np.ndarray(shape,dtype=float,buffer=self._shm.buf)[:] = values
+        self.spec = (self._shm.name,shape,list(columns),numeric,other)
+
+    def close(self):
+        'releases the shared memory block'
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+    @staticmethod
+    def attach(spec):
+        '''
+        returns: (shared memory handle, read-only dataframe viewing the shared block without copying, with
+                 the non-numeric columns in their original positions)
+        the handle must be kept alive for as long as the dataframe is used.
+        '''
+        name,shape,columns,numeric,other = spec
+        shm = _attach_untracked(name)
+        values = np.ndarray(shape,dtype=float,buffer=shm.buf)
+        values.flags.writeable = False
+        frame = pd.DataFrame(values,columns=numeric,copy=False)
+        for position,label in enumerate(columns):
+            if label in other:
+                frame.insert(position,label,other[label])
+        return shm, frame
+
+_untracked_lock = threading.Lock()
+
+def _attach_untracked(name):
+    '''
+    returns: the shared memory block called name, without registering it with the resource tracker. the
+             process that created the block owns it; before python 3.13 (no `track` argument) an
+             attaching process registers the block too, and the block is unlinked (with a leak
+             warning) when that process's tracker shuts down - while the owner may still use it.
+    '''
+    try:
+        return shared_memory.SharedMemory(name=name,track=False)
+    except TypeError:
+        pass
+    # unregistering after attaching is not an option: pool workers share the owner's tracker, and
+    # unregistering there drops the owner's own registration
+    with _untracked_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name,rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+##### per-worker view of the shared dataset #####
+_worker_data = {}
+
+def attach_worker(spec):
+    '''
+    ProcessPoolExecutor initializer: attaches the worker to the SharedFrame with the given spec,
+    which `worker_frame()` then returns
+    '''
+    _worker_data["shm"],_worker_data["frame"] = SharedFrame.attach(spec)
+
+def worker_frame():
+    '''returns: the read-only dataframe of the SharedFrame this worker process is attached to'''
+    try:
+        return _worker_data["frame"]
+    except KeyError:
+        raise RuntimeError("this process is not attached to a SharedFrame: pass `initializer=attach_worker`") from None
+
+def parameter_grid(param_grid):
+    '''
+    returns: list of parameter dicts - every combination of the values in param_grid
+
+    params:
+    [dict or list] param_grid: dict of parameter name -> list of values (or a list of such dicts)
+    '''
+    if isinstance(param_grid,dict):
+        param_grid = [param_grid]
+    grid = []
+    for sub_grid in param_grid:
+        names = list(sub_grid.keys())
+        grid += [dict(zip(names,values)) for values in itertools.product(*(sub_grid[name] for name in names))]
+    return grid
+
+def build_model(model_class,loss_type:str,uncertainty_type:str,training_data,test_data,params:dict):
+    '''
+    returns: an instance of model_class. params that are constructor arguments are passed to
+             the constructor; the rest (e.g. SBRModel's f0) are set as attributes afterwards.
+    '''
+    constructor_args = inspect.signature(model_class.__init__).parameters
+    init_params = {name:value for name,value in params.items() if name in constructor_args}
+    model = model_class(loss_type,uncertainty_type,training_data,test_data,**init_params)
+    for name,value in params.items():
+        if name not in init_params:
+            setattr(model,name,value)
+    return model
+
+def _score_fold(model_class,loss_type,uncertainty_type,params,fold,train_index,test_index):
+    data = worker_frame()
+    model = build_model(model_class,loss_type,uncertainty_type,
+                        data.iloc[train_index],data.iloc[test_index],params)
+    rows = []
+    for subset in ("train","test"):
+        loss,uncertainty = model.loss(subset)
+        rows.append({**params,"fold":fold,"subset":subset,"loss":loss,"uncertainty":uncertainty})
+    return rows
+
+def cross_validate(model_class,data,param_grid,loss_type:str,uncertainty_type:str,splitter=None,
+                   model_params:dict=None,columns:List[str]=None,max_workers:int=None):
+    '''
+    returns: tidy dataframe with one row per (parameter combination, fold, subset) holding the
+             `Model.loss` output for the train and test subsets of every fold.
+
+    params:
+    [type] model_class: Model subclass to fit and score
+    [DataFrame] data: full dataset to split into folds
+    [dict or list] param_grid: parameters to sweep (see parameter_grid); use {} for a plain cross-validation
+    [str] loss_type, uncertainty_type: as for Model
+    splitter: fold strategy with a `split(data)` method yielding (train_index, test_index) row positions.
+              defaults to KFoldSplitter()
+    [dict] model_params: parameters shared by every model in the sweep (e.g. covariate_labels)
+    [list] columns: columns to share with the workers, by default every column
+    [int] max_workers: number of worker processes
+    '''
+    if splitter is None:
+        splitter = KFoldSplitter()
+    folds = list(splitter.split(data))
+    grid = parameter_grid(param_grid)
+    rows = []
+    with SharedFrame(data,columns) as shared:
+        with ProcessPoolExecutor(max_workers=max_workers,initializer=attach_worker,initargs=(shared.spec,)) as executor:
+            futures = [executor.submit(_score_fold,model_class,loss_type,uncertainty_type,{**(model_params or {}),**params},
+                                       fold,train_index,test_index)
+                       for params in grid for fold,(train_index,test_index) in enumerate(folds)]
+            for future in futures:
+                rows += future.result()
+    return pd.DataFrame(rows)
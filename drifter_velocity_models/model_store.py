@@ -0,0 +1,96 @@
+'description: saving fitted models to disk and loading them back without refitting'
+
+##### import packages #####
+import os
+import json
+import pickle
+import hashlib
+import importlib
+import warnings
+import datetime
+import numpy as np
+import pandas as pd
+from model_classes import Model
+
+FORMAT_VERSION = 1
+METADATA_FILE = "metadata.json"
+OBJECTS_FILE = "objects.pkl"
+
+def training_fingerprint(data):
+    '''returns: sha256 hex digest identifying the contents (values, index and columns) of a dataframe'''
+    if data is None:
+        return None
+    if hasattr(data,"fingerprint"): # ColumnarData
+        return data.fingerprint()
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(label) for label in data.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(data,index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def save_model(model:Model,directory:str):
+    '''
+    writes the fitted state of model to directory: every parameter array as a memory-mappable
+    .npy file, any other fitted objects (e.g. the NGBoost ensemble) as a pickle, and a metadata.json
+    holding the format version, model class and type, loss/uncertainty types, covariate labels,
+    scalar attributes and a fingerprint of the training data.
+
+    params:
+    [Model] model: model to save (fitted first if it has not been)
+    [str] directory: artifact directory, created if it does not exist
+    '''
+    arrays,attributes,objects = model.artifact_state()
+    os.makedirs(directory,exist_ok=True)
+    for name,array in arrays.items():
+        np.save(os.path.join(directory,f"{name}.npy"),np.ascontiguousarray(array))
+    if objects:
+        with open(os.path.join(directory,OBJECTS_FILE),"wb") as file:
+            pickle.dump(objects,file,protocol=pickle.HIGHEST_PROTOCOL)
+    metadata = {"format_version":FORMAT_VERSION,
+                "created":datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "model_class":f"{type(model).__module__}.{type(model).__qualname__}",
+                "model_type":model.model_type,
+                "loss_type":model.loss_type,
+                "uncertainty_type":model.uncertainty_type,
+                "covariate_labels":attributes.get("covariate_labels"),
+                "training_fingerprint":training_fingerprint(model.training_data),
+                "arrays":sorted(arrays),
+                "attributes":attributes,
+                "objects":sorted(objects)}
+    with open(os.path.join(directory,METADATA_FILE),"w") as file:
+        json.dump(metadata,file,indent=2)
+
+def read_metadata(directory:str):
+    '''returns: the metadata of the artifact in directory'''
+    with open(os.path.join(directory,METADATA_FILE)) as file:
+        metadata = json.load(file)
+    if metadata.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"artifact format version {metadata.get('format_version')} is not supported (expected {FORMAT_VERSION})")
+    return metadata
+
+def load_model(directory:str,training_data=None,test_data=None,mmap:bool=True):
+    '''
+    returns: the model saved in directory, ready to predict without refitting
+
+    params:
+    [str] directory: artifact directory written by save_model
+    [DataFrame] training_data, test_data: optional data to attach to the model. a warning is raised
+                                          if training_data differs from the data the model was fitted on.
+    [bool] mmap: memory-map the parameter arrays (read-only, shared between processes) instead of reading them
+    '''
+    metadata = read_metadata(directory)
+    module_name,class_name = metadata["model_class"].rsplit(".",1)
+    model_class = getattr(importlib.import_module(module_name),class_name)
+    arrays = {name:np.load(os.path.join(directory,f"{name}.npy"),mmap_mode="r" if mmap else None)
+              for name in metadata["arrays"]}
+    objects = {}
+    if metadata["objects"]:
+        with open(os.path.join(directory,OBJECTS_FILE),"rb") as file:
+            objects = pickle.load(file)
+    if training_data is not None and training_fingerprint(training_data) != metadata["training_fingerprint"]:
+        warnings.warn("training_data differs from the data the saved model was fitted on")
+    # the sub-type constructors fit to (or require) training data, so only the Model state is initialised
+    model = model_class.__new__(model_class)
+    Model.__init__(model,metadata["loss_type"],metadata["uncertainty_type"],training_data,test_data)
+    model.model_type = metadata["model_type"]
+    model.restore_artifact_state(arrays,metadata["attributes"],objects)
+    return model
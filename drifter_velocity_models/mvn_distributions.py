@@ -0,0 +1,103 @@
+'description: batched multivariate normal distributions for the probabilistic regression models'
+
+##### import packages #####
+import numpy as np
+from numpy import linalg
+from scipy import stats
+
+class MultivariateNormalBatch:
+    '''
+    N multivariate normal distributions stored as arrays, loc (N,d) and cov (N,d,d), so that
+    sampling and density evaluation run as single vectorised operations over every row instead
+    of through one scipy.stats.multivariate_normal object per row.
+    '''
+    def __init__(self,loc,cov):
+        loc = np.asarray(loc,dtype=float)
+        cov = np.asarray(cov,dtype=float)
+        if loc.ndim != 2 or cov.shape != loc.shape+loc.shape[1:]:
+            raise ValueError(f"expected loc of shape (N,d) and cov of shape (N,d,d); got {loc.shape} and {cov.shape}")
+        self.loc = loc
+        self.cov = cov
+        self._cholesky = None
+
+    def __len__(self):
+        return self.loc.shape[0]
+
+    def __getitem__(self,index):
+        'an integer index returns the scipy distribution for that row; anything else returns a sub-batch'
+        if isinstance(index,(int,np.integer)):
+            return stats.multivariate_normal(self.loc[index],self.cov[index])
+        return MultivariateNormalBatch(self.loc[index],self.cov[index])
+
+    def __iter__(self):
+        for ii in range(len(self)):
+            yield self[ii]
+
+    #----------------------- properties -----------------------#
+    @property
+    def dim(self):
+        return self.loc.shape[1]
+
+    @property
+    def cholesky(self):
+        '(N,d,d) lower triangular cholesky factors of cov, computed once on first use'
+        if self._cholesky is None:
+            try:
+                self._cholesky = linalg.cholesky(self.cov)
+            except linalg.LinAlgError:
+                raise ValueError("covariance matrices must be symmetric positive definite")
+        return self._cholesky
+
+    #----------------------- distribution methods -----------------------#
+    def mean(self):
+        'returns: (N,d) array of means'
+        return self.loc
+
+    def std(self):
+        'returns: (N,d) array of marginal standard deviations'
+        return np.sqrt(np.diagonal(self.cov,axis1=1,axis2=2))
+
+    def rvs(self,size:int=1,random_state=None):
+        '''
+        returns: (N,size,d) array of samples, size draws from every distribution
+
+        params:
+        [int] size: number of samples per distribution
+        random_state: seed or numpy Generator
+        '''
+        rng = np.random.default_rng(random_state)
+        z = rng.standard_normal((len(self),size,self.dim))
+        return self.loc[:,np.newaxis,:]+np.einsum("nij,nkj->nki",self.cholesky,z)
+
+    def logpdf(self,x):
+        '''
+        returns: log densities of x - shape (N,) for x of shape (N,d), or (N,m) for x of shape (N,m,d)
+                 (m points per distribution)
+
+        params:
+        [array] x: points at which to evaluate the densities
+        '''
+        x = np.asarray(x,dtype=float)
+        single = x.ndim == 2
+        diff = (x[:,np.newaxis,:] if single else x)-self.loc[:,np.newaxis,:]
+        whitened = linalg.solve(self.cholesky,np.swapaxes(diff,1,2))
+        mahalanobis = np.sum(np.square(whitened),axis=1)
+        log_det = 2*np.sum(np.log(np.diagonal(self.cholesky,axis1=1,axis2=2)),axis=1)
+        logpdf = -0.5*(self.dim*np.log(2*np.pi)+log_det[:,np.newaxis]+mahalanobis)
+        return logpdf[:,0] if single else logpdf
+
+    def pdf(self,x):
+        'returns: densities of x (see logpdf)'
+        return np.exp(self.logpdf(x))
+
+    def quantile(self,q):
+        '''
+        returns: marginal quantiles of every component - shape (N,d) for scalar q, or (N,k,d) for k levels
+
+        params:
+        [float or array] q: quantile level(s) in (0,1)
+        '''
+        z = stats.norm.ppf(q)
+        if np.ndim(z) == 0:
+            return self.loc+z*self.std()
+        return self.loc[:,np.newaxis,:]+np.asarray(z)[np.newaxis,:,np.newaxis]*self.std()[:,np.newaxis,:]
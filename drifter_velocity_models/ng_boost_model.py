@@ -1,15 +1,25 @@
 from model_classes import Model
 # import packages
 import numpy as np
+import pandas as pd
 import ngboost
-from scipy import stats
+from typing import List
+from mvn_distributions import MultivariateNormalBatch
+from instrumentation import instrumented, rows_of_argument, rows_of_attribute
 
 class NGBoostModel(Model):
+    '''
+    ngboost probabilistic regression of the velocity columns target_columns (default `u`,`v`) on the
+    covariates given by covariate_labels
+    '''
 
-    def __init__(self,loss_type,training_data,test_data,covariate_labels,num_estimators):
-        super().__init__(loss_type,training_data,test_data)
+    def __init__(self,loss_type,uncertainty_type,training_data,test_data,covariate_labels,num_estimators,prediction_mode="mean",
+                 validation_data=None,early_stopping_rounds=None,feature_pipeline=None,target_columns=("u","v")):
+        super().__init__(loss_type,uncertainty_type,training_data,test_data)
         self.model_type = "ngboost_pr"
         self.covariate_labels = covariate_labels
+        self.target_columns = list(target_columns) # velocity columns the ensemble is fitted to
+        self.feature_pipeline = feature_pipeline # optional FeaturePipeline deriving covariates that are not columns
         self.num_estimators = num_estimators
         # model specification
         self.model_function = None
@@ -17,29 +27,158 @@ class NGBoostModel(Model):
         self.trained_realisations = None
         self.test_realisations = None
         ## average of predictions for rmse
+        self.prediction_mode = prediction_mode
         self.trained_prediction = None
         self.testing_prediction = None
+        ## early stopping and truncation
+        self.validation_data = validation_data
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_curve = None
+        self.best_iteration = None
+        self.prediction_estimators = None
 
     #------------------------ model constructions -------------------------#
+    @instrumented(rows=rows_of_attribute("training_data"))
     def ngboost_pr(self):
-        '''return probabilistic regression model'''
+        '''
+        return probabilistic regression model. with validation_data the training and validation loss of
+        every boosting iteration are recorded in validation_curve; with early_stopping_rounds training stops
+        once the validation loss has not improved for that many iterations (on a fixed validation split of
+        the training data if no validation_data is given, see validation_split) and predictions use the
+        best iteration.
+        '''
         self.model_function = ngboost.NGBoost(Dist=ngboost.distns.MultivariateNormal(2),
-                               n_estimators=self.num_estimators)
-        
-        self.model_function.fit(X=np.array(self.training_data.loc[:,self.covariate_labels]),
-                                   Y=np.array(self.training_data.loc[:,["u","v"]]))
-    
-    def trained_pred_dist(self):
+                               n_estimators=self.num_estimators,early_stopping_rounds=self.early_stopping_rounds)
+        fit_args = self._fit_args()
+        self.model_function.fit(**fit_args)
+        self.validation_curve = None
+        self._record_validation_curve(fit_args["X"],fit_args["Y"])
+
+    @instrumented(rows=rows_of_attribute("training_data"))
+    def warm_start(self,num_estimators:int):
+        '''
+        fits num_estimators further boosting iterations on top of the fitted model (fitting it first if
+        needed) and extends validation_curve, instead of retraining with the larger num_estimators.
+        '''
         if self.model_function is None:
             self.ngboost_pr()
-        pred_dist = self.model_function.pred_dist(np.array(self.training_data.loc[:,self.covariate_labels]))
-        self.trained_distribution =[stats.multivariate_normal(pred_dist.loc[ii,:],pred_dist.cov[ii,:,:]) for ii in range(pred_dist.loc.shape[0])]
+        self.model_function.n_estimators = num_estimators
+        fit_args = self._fit_args()
+        self.model_function.partial_fit(**fit_args)
+        self.model_function.n_estimators = self.fitted_estimators
+        self.num_estimators = self.fitted_estimators
+        self._record_validation_curve(fit_args["X"],fit_args["Y"])
+
+    def validation_split(self):
+        '''
+        returns: boolean mask of the training rows held out for early stopping when no validation_data is
+                 given - a `validation_fraction` of the rows drawn with a fixed seed, so that every fit and
+                 warm start of the same training data holds out the same rows
+        '''
+        num_rows = len(self.training_data)
+        held_out = np.zeros(num_rows,dtype=bool)
+        held_out[np.random.default_rng(0).permutation(num_rows)[:int(np.ceil(self.model_function.validation_fraction*num_rows))]] = True
+        return held_out
+
+    def _fit_args(self):
+        '''
+        returns: the X, Y (and X_val, Y_val) arguments of fit/partial_fit. with early stopping and no
+                 validation_data, the validation set is split off here rather than by ngboost, which would
+                 draw a new split on every partial_fit and so train on earlier validation rows
+        '''
+        X = self.covariates(self.training_data)
+        Y = self.extract_columns(self.training_data,self.target_columns)
+        if self.validation_data is not None:
+            return {"X":X,"Y":Y,"X_val":self.covariates(self.validation_data),
+                    "Y_val":self.extract_columns(self.validation_data,self.target_columns)}
+        if self.early_stopping_rounds is None:
+            return {"X":X,"Y":Y}
+        held_out = self.validation_split()
+        return {"X":X[~held_out],"Y":Y[~held_out],"X_val":X[held_out],"Y_val":Y[held_out]}
+
+    def _record_validation_curve(self,X,Y):
+        '''
+        appends the losses of the iterations added by the last fit (on training covariates X and velocities Y)
+        to validation_curve and updates best_iteration. ngboost records the training loss of an iteration
+        before its update and the validation loss after it, so the training losses are recomputed from the
+        staged parameters: both columns are then the loss of the ensemble of num_estimators iterations.
+        '''
+        evals = self.model_function.evals_result
+        start = self.fitted_estimators-len(next(iter(evals["train"].values())))
+        model = self.model_function
+        train_loss = [model.Manifold(params.T).total_score(Y)
+                      for _,params in self._staged_params(X,range(start+1,self.fitted_estimators+1))]
+        val_loss = next(iter(evals["val"].values())) if "val" in evals else [np.nan]*len(train_loss)
+        curve = pd.DataFrame({"num_estimators":np.arange(start+1,self.fitted_estimators+1),
+                              "train_loss":train_loss,"val_loss":val_loss})
+        self.validation_curve = curve if self.validation_curve is None else \
+                                pd.concat([self.validation_curve,curve],ignore_index=True)
+        val_loss = self.validation_curve["val_loss"]
+        self.best_iteration = None if val_loss.isna().all() else int(self.validation_curve["num_estimators"][val_loss.idxmin()])
+        # sets (and resets) the predictions of the new ensemble
+        self.prediction_estimators = self.best_iteration if self.early_stopping_rounds is not None else None
     
-    def test_pred_dist(self):
+    def covariates(self,data):
+        '''returns the matrix of covariates in data given by covariate_labels (derived by feature_pipeline if given)'''
+        if self.feature_pipeline is not None:
+            return self.feature_pipeline.covariates(data,self.covariate_labels)
+        try:
+            return self.extract_columns(data,self.covariate_labels)
+        except KeyError:
+            raise KeyError("Covariate(s) were not found in the dataset")
+
+    @instrumented(rows=rows_of_argument(1))
+    def predictive_distribution(self,data):
+        '''returns the MultivariateNormalBatch of predicted velocity distributions for every row of data'''
+        if self.model_function is None:
+            self.ngboost_pr()
+        pred_dist = self.model_function.pred_dist(self.covariates(data),max_iter=self.prediction_estimators)
+        return MultivariateNormalBatch(pred_dist.loc,pred_dist.cov)
+
+    def staged_distributions(self,data,num_estimators:List[int]):
+        '''
+        yields (n, distribution) - the ngboost predictive distributions for every row of data after the first
+        n boosting iterations, for each n in num_estimators (ascending), in a single pass over the ensemble
+        '''
         if self.model_function is None:
             self.ngboost_pr()
-        pred_dist = self.model_function.pred_dist(np.array(self.test_data.loc[:,self.covariate_labels]))
-        self.test_distribution = [stats.multivariate_normal(pred_dist.loc[ii,:],pred_dist.cov[ii,:,:]) for ii in range(pred_dist.loc.shape[0])]
+        stages = sorted(set(num_estimators))
+        if stages[0] < 1 or stages[-1] > self.fitted_estimators:
+            raise ValueError(f"num_estimators must be between 1 and the {self.fitted_estimators} fitted estimators")
+        for n,params in self._staged_params(self.covariates(data),stages):
+            yield n, self.model_function.Dist(np.copy(params.T))
+
+    def _staged_params(self,X,stages):
+        'yields (n, params) - the (N,n_params) distribution parameters for covariates X after the first n iterations, for each n in stages (ascending)'
+        model = self.model_function
+        stages = set(stages)
+        last = max(stages,default=0)
+        params = np.ones((X.shape[0],model.Dist.n_params))*model.init_params
+        for n,(base_models,scaling,col_idx) in enumerate(zip(model.base_models,model.scalings,model.col_idxs),start=1):
+            if n > last:
+                return
+            params -= model.learning_rate*scaling*np.array([base.predict(X[:,col_idx]) for base in base_models]).T
+            if n in stages:
+                yield n, params
+
+    def estimator_sweep(self,num_estimators:List[int],test_or_train:str="test"):
+        '''
+        returns: dataframe of the loss and uncertainty (of the predictive means) of the model truncated to
+                 each of num_estimators boosting iterations - a whole estimator sweep from a single fit
+        '''
+        obs = self.observations(test_or_train)
+        rows = []
+        for n,distribution in self.staged_distributions(self.data_subset(test_or_train),num_estimators):
+            preds = distribution.loc
+            rows.append({"num_estimators":n,"loss":self.loss_function(obs,preds),
+                         "uncertainty":self.uncertainty_function(obs,preds)})
+        return pd.DataFrame(rows)
+
+    def trained_pred_dist(self):
+        self.trained_distribution = self.predictive_distribution(self.training_data)
+    
+    def test_pred_dist(self):
+        self.test_distribution = self.predictive_distribution(self.test_data)
 
     #----------------------- 'immutable' properties -----------------------#
     @property
@@ -50,27 +189,154 @@ class NGBoostModel(Model):
     def num_estimators(self,n):
         self._num_estimators = n
 
+    @property
+    def prediction_mode(self):
+        '''`mean` (default): point predictions are the analytic means of the predictive distributions.
+           `sample`: point predictions are the average of `num_pred` realisations (see `trained_predictions`).'''
+        return self._prediction_mode
+
+    @prediction_mode.setter
+    def prediction_mode(self,mode):
+        if mode not in ("mean","sample"):
+            raise ValueError("prediction mode must be either `mean` or `sample`")
+        self._prediction_mode = mode
+        # the point predictions (and losses) of the other mode are discarded, the realisations are kept
+        self.trained_prediction = None
+        self.testing_prediction = None
+
+    @property
+    def fitted_estimators(self):
+        'number of boosting iterations in the fitted ensemble'
+        return len(self.model_function.base_models) if self.model_function is not None else 0
+
+    @property
+    def prediction_estimators(self):
+        '''(setter) number of boosting iterations used for prediction (default None: all of them).
+           setting it truncates the fitted ensemble without refitting and resets the predictions'''
+        return self._prediction_estimators
+
+    @prediction_estimators.setter
+    def prediction_estimators(self,n):
+        if n is not None and n < 1:
+            raise ValueError("prediction_estimators must be a positive number of boosting iterations")
+        self._prediction_estimators = n
+        self.reset_predictions()
+
+    @property
+    def trained_prediction(self):
+        '''point prediction for the training data - computed on first access (from the realisations in `sample` mode)'''
+        if self._trained_prediction is None:
+            self.calculate_trained_prediction()
+        return self._trained_prediction
+
+    @trained_prediction.setter
+    def trained_prediction(self,pred):
+        self._trained_prediction = pred
+        self.clear_predictions()
+
+    @property
+    def testing_prediction(self):
+        '''point prediction for the test data - computed on first access (from the realisations in `sample` mode)'''
+        if self._testing_prediction is None:
+            self.calculate_testing_prediction()
+        return self._testing_prediction
+
+    @testing_prediction.setter
+    def testing_prediction(self,pred):
+        self._testing_prediction = pred
+        self.clear_predictions()
+
+    @property
+    def trained_covariance(self):
+        '''(N,2,2) analytic covariances of the predictive distributions for the training data'''
+        if self.trained_distribution is None:
+            self.trained_pred_dist()
+        return self.trained_distribution.cov
+
+    @property
+    def test_covariance(self):
+        '''(N,2,2) analytic covariances of the predictive distributions for the test data'''
+        if self.test_distribution is None:
+            self.test_pred_dist()
+        return self.test_distribution.cov
+
     #----------------------- predictions -----------------------#
+    def reset_predictions(self,test_or_train:str=None):
+        'discards the predictive distributions, realisations and point predictions (for one data subset if given)'
+        if test_or_train in (None,"train"):
+            self.trained_distribution = None
+            self.trained_realisations = None
+            self.trained_prediction = None
+        if test_or_train in (None,"test"):
+            self.test_distribution = None
+            self.test_realisations = None
+            self.testing_prediction = None
+
+    def clear_cache(self,test_or_train:str=None):
+        super().clear_cache(test_or_train)
+        self.reset_predictions(test_or_train)
+
+    def reset_fit(self):
+        'discards the fitted ensemble, its validation curve and truncation (and with them the predictions)'
+        self.model_function = None
+        self.validation_curve = None
+        self.best_iteration = None
+        self.prediction_estimators = None
+
     def trained_predictions(self,num_pred):
         if self.trained_distribution is None:
             self.trained_pred_dist()
-        self.trained_realisations = [distribution.rvs(num_pred) for distribution in self.trained_distribution]
+        self.trained_realisations = self.trained_distribution.rvs(num_pred)
+        self.trained_prediction = None
     
     def testing_predictions(self,num_pred):
         if self.test_distribution is None:
             self.test_pred_dist()
-        self.test_realisations = [distribution.rvs(num_pred) for distribution in self.test_distribution]
+        self.test_realisations = self.test_distribution.rvs(num_pred)
+        self.testing_prediction = None
 
     def calculate_trained_prediction(self):
+        if self.prediction_mode == "mean":
+            if self.trained_distribution is None:
+                self.trained_pred_dist()
+            self.trained_prediction = self.trained_distribution.mean()
+            return
         if self.trained_realisations is None:
             raise AttributeError("no realisations of the trained mvn distribution. First run `self.trained_predictions(num_pred)`.")
         self.trained_prediction = np.mean(self.trained_realisations,axis=1)
 
     def calculate_testing_prediction(self):
+        if self.prediction_mode == "mean":
+            if self.test_distribution is None:
+                self.test_pred_dist()
+            self.testing_prediction = self.test_distribution.mean()
+            return
         if self.test_realisations is None:
             raise AttributeError("no realisations of the test mvn distribution. First run `self.testing_predictions(num_pred)`.")
         self.testing_prediction =  np.mean(self.test_realisations,axis=1)
 
-    
+    @instrumented(rows=rows_of_argument(1))
+    def predict(self,data):
+        '''returns the analytic predictive means for every row of data'''
+        return self.predictive_distribution(data).mean()
+
+    #----------------------- persistence -----------------------#
+    def artifact_state(self):
+        if self.model_function is None:
+            self.ngboost_pr()
+        return ({},
+                {"covariate_labels":list(self.covariate_labels),"target_columns":list(self.target_columns),
+                 "num_estimators":int(self.num_estimators),
+                 "prediction_mode":self.prediction_mode,"early_stopping_rounds":self.early_stopping_rounds,
+                 "best_iteration":self.best_iteration,"prediction_estimators":self.prediction_estimators},
+                {"model_function":self.model_function,"validation_curve":self.validation_curve,
+                 "feature_pipeline":self.feature_pipeline})
 
-    
\ No newline at end of file
+    def restore_artifact_state(self,arrays,attributes,objects):
+        self.validation_data = None
+        self.early_stopping_rounds = None
+        self.feature_pipeline = None
+        self.validation_curve = None
+        self.best_iteration = None
+        self.prediction_estimators = None # also initialises the predictions
+        super().restore_artifact_state(arrays,attributes,objects)
@@ -0,0 +1,195 @@
+'description: reproducible throughput and memory benchmarks for model fitting, prediction and losses'
+
+##### import packages #####
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from typing import List
+from model_classes import Model
+from benchmark_models import BathtubModel, SBRModel, FixedCurrentModel
+from linear_regression_model import LinearRegressionModel
+try:
+    from ng_boost_model import NGBoostModel
+except ImportError: # ngboost is only needed for the probabilistic model
+    NGBoostModel = None
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% SYNTHETIC DATA %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+
+def synthetic_drifter_data(num_rows:int,num_covariates:int=2,random_state=0):
+    '''
+    returns: dataframe of num_rows synthetic drifter observations with `lon`, `lat`, `u`, `v` and
+             covariate columns `covariate_0`, `covariate_1`, ... (velocities in m/s, linear in the covariates)
+
+    params:
+    [int] num_rows: number of rows
+    [int] num_covariates: number of covariate columns
+    random_state: seed, so that runs are reproducible
+    '''
+    rng = np.random.default_rng(random_state)
+    data = {"lon":rng.uniform(-180.,180.,num_rows),
+            "lat":rng.uniform(-80.,80.,num_rows)}
+    covariates = rng.normal(size=(num_rows,num_covariates))
+    for ii in range(num_covariates):
+        data[f"covariate_{ii}"] = covariates[:,ii]
+    velocities = np.matmul(covariates,rng.normal(scale=0.1,size=(num_covariates,2)))+rng.normal(scale=0.2,size=(num_rows,2))
+    data["u"] = velocities[:,0]
+    data["v"] = velocities[:,1]
+    return pd.DataFrame(data)
+
+def covariate_labels(data):
+    return [label for label in data.columns if label.startswith("covariate_")]
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% MEASUREMENT %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+
+def measure(name:str,num_rows:int,setup,func,repeat:int=3):
+    '''
+    returns: dict with the best wall time over `repeat` runs of func(setup()), the corresponding
+             rows/sec and the peak memory (bytes, tracked by tracemalloc) allocated by one run.
+             setup is not timed.
+    '''
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        func(state)
+        times.append(time.perf_counter()-start)
+    state = setup()
+    tracemalloc.start()
+    try:
+        func(state)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    seconds = min(times)
+    return {"benchmark":name,"rows":num_rows,"seconds":seconds,
+            "rows_per_second":num_rows/seconds if seconds > 0 else float("inf"),
+            "peak_memory_bytes":peak_memory}
+
+def model_factories(training_data,test_data,num_estimators:int=10):
+    '''returns: dict of model name -> function building a fresh (unfitted) model on the given data'''
+    labels = covariate_labels(training_data)
+    factories = {
+        "bathtub":lambda: BathtubModel("rmse","sre",training_data,test_data),
+        "sbr":lambda: SBRModel("rmse","sre",training_data,test_data),
+        "fixedcurrent":lambda: FixedCurrentModel("rmse","sre",training_data,test_data),
+        "lr":lambda: LinearRegressionModel("rmse","sre",training_data,test_data,labels)}
+    if NGBoostModel is not None:
+        factories["ngboost_pr"] = lambda: NGBoostModel("rmse","sre",training_data,test_data,labels,num_estimators)
+    return factories
+
+def fit(model):
+    'fits the model parameters (a no-op for models without any)'
+    if isinstance(model,LinearRegressionModel):
+        model.calculate_param_estimate()
+    elif NGBoostModel is not None and isinstance(model,NGBoostModel):
+        model.ngboost_pr()
+    return model
+
+def run_benchmarks(num_rows:int=100_000,repeat:int=3,num_covariates:int=2,models:List[str]=None,
+                   num_estimators:int=10,random_state=0):
+    '''
+    returns: dict with the environment and one result per benchmark - fit, trained_prediction,
+             testing_prediction and loss for every model, plus every loss and uncertainty function and
+             every (loss, uncertainty) pair evaluated together as in `Model.loss`.
+
+    params:
+    [int] num_rows: rows of synthetic training data (and of test data)
+    [int] repeat: runs per benchmark (the best time is reported)
+    [int] num_covariates: covariate columns in the synthetic data
+    [list] models: names of the models to benchmark (default: all available)
+    [int] num_estimators: boosting iterations for NGBoostModel
+    '''
+    training_data = synthetic_drifter_data(num_rows,num_covariates,random_state)
+    test_data = synthetic_drifter_data(num_rows,num_covariates,random_state+1)
+    factories = model_factories(training_data,test_data,num_estimators)
+    if models is not None:
+        factories = {name:factories[name] for name in models}
+    results = []
+    for name,factory in factories.items():
+        fitted = lambda factory=factory: fit(factory())
+        results.append(measure(f"{name}.fit",num_rows,lambda: None,lambda _,factory=factory: fit(factory()),repeat))
+        results.append(measure(f"{name}.trained_prediction",num_rows,fitted,lambda model: model.trained_prediction,repeat))
+        results.append(measure(f"{name}.testing_prediction",num_rows,fitted,lambda model: model.testing_prediction,repeat))
+        results.append(measure(f"{name}.loss",num_rows,fitted,lambda model: model.loss("test"),repeat))
+    rng = np.random.default_rng(random_state)
+    obs,preds = rng.normal(size=(num_rows,2)),rng.normal(size=(num_rows,2))
+    for name,function in {**Model.loss_functions,**Model.uncertainty_functions}.items():
+        results.append(measure(f"{name}",num_rows,lambda: None,lambda _,function=function: function(obs,preds),repeat))
+    # every (loss, uncertainty) pair in the single residual_statistics pass behind Model.loss
+    for loss_type in Model.loss_functions:
+        for uncertainty_type in Model.uncertainty_functions:
+            keys = Model.required_statistics([loss_type,uncertainty_type])
+            results.append(measure(f"{loss_type}+{uncertainty_type}",num_rows,lambda: None,
+                                   lambda _,keys=keys: Model.residual_statistics(obs,preds,keys=keys),repeat))
+    return {"environment":{"python":sys.version.split()[0],"numpy":np.__version__,"pandas":pd.__version__,
+                           "platform":platform.platform()},
+            "parameters":{"num_rows":num_rows,"repeat":repeat,"num_covariates":num_covariates,
+                          "num_estimators":num_estimators,"random_state":random_state},
+            "results":results}
+
+#%%%%%%%%%%%%%%%%%%%%%%%%%%%% RESULTS %%%%%%%%%%%%%%%%%%%%%%%%%%%%%#
+
+def save_results(results:dict,path:str):
+    with open(path,"w") as file:
+        json.dump(results,file,indent=2)
+
+def load_results(path:str):
+    with open(path) as file:
+        return json.load(file)
+
+def compare_to_baseline(results:dict,baseline:dict,tolerance:float=0.2):
+    '''
+    returns: list of regressions - benchmarks whose rows/sec fell by more than the fraction
+             `tolerance` relative to the baseline. benchmarks missing from either run are ignored.
+    '''
+    baseline_results = {result["benchmark"]:result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        reference = baseline_results.get(result["benchmark"])
+        if reference is None:
+            continue
+        ratio = result["rows_per_second"]/reference["rows_per_second"]
+        if ratio < 1-tolerance:
+            regressions.append({"benchmark":result["benchmark"],"ratio":ratio,
+                                "rows_per_second":result["rows_per_second"],
+                                "baseline_rows_per_second":reference["rows_per_second"]})
+    return regressions
+
+def report(results:dict):
+    'returns: the results formatted as a text table'
+    lines = [f"{'benchmark':<40}{'rows/sec':>16}{'seconds':>12}{'peak MiB':>12}"]
+    for result in results["results"]:
+        lines.append(f"{result['benchmark']:<40}{result['rows_per_second']:>16.4g}"
+                     f"{result['seconds']:>12.4g}{result['peak_memory_bytes']/2**20:>12.2f}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark model fit, predict and loss throughput")
+    parser.add_argument("--rows",type=int,default=100_000,help="rows of synthetic training (and test) data")
+    parser.add_argument("--repeat",type=int,default=3,help="runs per benchmark")
+    parser.add_argument("--covariates",type=int,default=2,help="number of covariate columns")
+    parser.add_argument("--models",nargs="*",default=None,help="models to benchmark (default: all)")
+    parser.add_argument("--num-estimators",type=int,default=10,help="boosting iterations for ngboost_pr")
+    parser.add_argument("--output",default=None,help="write results to this json file")
+    parser.add_argument("--baseline",default=None,help="compare against results saved in this json file")
+    parser.add_argument("--tolerance",type=float,default=0.2,help="allowed fractional drop in rows/sec")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.rows,args.repeat,args.covariates,args.models,args.num_estimators)
+    print(report(results))
+    if args.output is not None:
+        save_results(results,args.output)
+    if args.baseline is not None:
+        regressions = compare_to_baseline(results,load_results(args.baseline),args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['benchmark']}: {regression['ratio']:.2f}x baseline rows/sec")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+'description: local asyncio scoring service answering velocity queries with fitted models'
+
+##### import packages #####
+import asyncio
+import collections
+import time
+import numpy as np
+import pandas as pd
+from model_classes import Model
+
+##### splitmix64 constants, mixing the key words of a query row into one 64-bit hash #####
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+def _mix(z):
+    'returns: the splitmix64 finaliser of the uint64 array z (wrapping arithmetic)'
+    z = (z^(z>>np.uint64(30)))*_MIX_1
+    z = (z^(z>>np.uint64(27)))*_MIX_2
+    return z^(z>>np.uint64(31))
+
+class PredictionCache:
+    '''
+    array-backed LRU cache of the predictions of query rows. a row is keyed by the exact bits of all of
+    its values (the snapped lon, lat and every covariate, as uint64 words), mixed into one 64-bit hash:
+    the table holds the hashes (sorted), the key words, the predicted velocity and the tick of the
+    last request using each row, so a whole query is looked up with one np.searchsorted. a hash is
+    only a hit if the key words match too; a row whose hash is taken by a different key is not cached.
+    '''
+    def __init__(self,size:int):
+        self.size = size
+        self.clear()
+
+    @staticmethod
+    def keys(query):
+        'returns: (N,k) uint64 key words of the rows of a query (dict of k columns), or None if a column is not numeric'
+        words = []
+        for values in query.values():
+            if values.dtype.kind in "fiumM" and values.dtype.itemsize == 8:
+                words.append(np.ascontiguousarray(values).view(np.uint64))
+            elif values.dtype.kind in "biuf":
+                words.append(values.astype(np.float64).view(np.uint64))
+            else:
+                return None
+        return np.column_stack(words)
+
+    @staticmethod
+    def hashes(keys):
+        'returns: (N,) uint64 hash of every row of key words'
+        hashes = np.full(keys.shape[0],_GOLDEN_GAMMA)
+        for column in keys.T:
+            hashes = _mix(hashes^column)
+        return hashes
+
+    def lookup(self,keys,hashes,result):
+        'fills result with cached predictions and returns the positions of the cache misses'
+        self._tick += 1
+        if self._hashes.size == 0:
+            return np.arange(keys.shape[0])
+        position = np.minimum(np.searchsorted(self._hashes,hashes),self._hashes.size-1)
+        hit = self._hashes[position] == hashes
+        hit[hit] = np.all(self._keys[position[hit]] == keys[hit],axis=1)
+        result[hit] = self._velocities[position[hit]]
+        self._last_used[position[hit]] = self._tick
+        return np.flatnonzero(~hit)
+
+    def store(self,keys,hashes,velocities):
+        'adds the predictions of new rows, evicting the least recently used rows beyond size'
+        hashes,first = np.unique(hashes,return_index=True)
+        new = ~np.isin(hashes,self._hashes,assume_unique=True) # (rows predicted by a concurrent request are kept)
+        first = first[new]
+        hashes = np.concatenate((self._hashes,hashes[new]))
+        keys = np.concatenate((self._keys.reshape(-1,keys.shape[1]),keys[first]))
+        velocities = np.concatenate((self._velocities,velocities[first]))
+        last_used = np.concatenate((self._last_used,np.full(first.size,self._tick)))
+        keep = np.arange(hashes.size)
+        if hashes.size > self.size:
+            keep = np.argpartition(last_used,hashes.size-self.size)[hashes.size-self.size:]
+        keep = keep[np.argsort(hashes[keep])]
+        self._hashes,self._keys,self._velocities,self._last_used = hashes[keep],keys[keep],velocities[keep],last_used[keep]
+
+    def __len__(self):
+        return self._hashes.size
+
+    def clear(self):
+        self._hashes = np.empty(0,dtype=np.uint64)
+        self._keys = np.empty((0,0),dtype=np.uint64)
+        self._velocities = np.empty((0,2))
+        self._last_used = np.empty(0,dtype=np.int64)
+        self._tick = 0
+
+class ScoringService:
+    '''
+    serves the velocity predictions of a fitted model to concurrent callers. queries are arbitrary
+    lon/lat positions (plus whatever covariates the model predicts from); the positions of concurrent
+    queries are coalesced into micro-batches of up to max_batch_rows rows, collected for at most
+    max_wait seconds, and predicted with one call of the model's vectorised `predict` (on a worker
+    thread, so the event loop keeps accepting queries). positions are snapped to a grid of
+    cache_decimals decimals and the predictions of the queried rows (position and covariates) are kept
+    in an array-backed LRU cache, so repeated queries of the same grid points skip the model (see
+    PredictionCache).
+
+    usage:
+        async with ScoringService(model) as service:
+            velocities = await service.predict(lon,lat)
+        service.stats()
+    '''
+    def __init__(self,model:Model,max_batch_rows:int=8192,max_wait:float=0.002,cache_size:int=100_000,
+                 cache_decimals:int=4,max_latencies:int=100_000):
+        '''
+        params:
+        [Model] model: fitted model implementing `predict`
+        [int] max_batch_rows: largest number of rows predicted in one batch
+        [float] max_wait: longest time (seconds) a query waits for other queries to share its batch
+        [int] cache_size: number of query rows whose predictions are cached, per set of covariates (0: no cache)
+        [int] cache_decimals: positions are rounded to this many decimals (snapped to a grid) before they
+                              are predicted - 4 decimals is ~10 m. None: no snapping, exact positions
+        [int] max_latencies: number of most recent request latencies kept for the percentiles
+        '''
+        self.model = model
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self.cache_decimals = cache_decimals
+        self.clear_cache()
+        self._queue = None
+        self._task = None
+        self._pending = [] # queries taken off the queue by the batching task and not yet answered
+        self.latencies = collections.deque(maxlen=max_latencies)
+        self.reset_stats()
+
+    #----------------------- lifecycle -----------------------#
+    async def start(self):
+        'starts the batching task (in the running event loop)'
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def stop(self):
+        'stops the batching task, failing any queries still waiting for a batch'
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            while not self._queue.empty():
+                self._fail([self._queue.get_nowait()])
+
+    @staticmethod
+    def _fail(pending):
+        for _,future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("the scoring service was stopped"))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self,*exc_info):
+        await self.stop()
+
+    #----------------------- queries -----------------------#
+    async def predict(self,lon,lat,covariates:dict=None):
+        '''
+        returns: (N,2) array of predicted velocities [u,v] at the N query positions
+
+        params:
+        [array] lon, lat: query positions in degrees
+        [dict] covariates: column label -> array of N values, for models predicting from covariates
+        '''
+        if self._task is None:
+            raise RuntimeError("the scoring service is not running, call `start` or use `async with`")
+        start = time.perf_counter()
+        query = self._query(lon,lat,covariates)
+        num_rows = query["lon"].shape[0]
+        result = np.empty((num_rows,2))
+        cache,keys = self._cache(query)
+        if cache is not None:
+            hashes = cache.hashes(keys)
+            misses = cache.lookup(keys,hashes,result)
+            self.cache_hits += num_rows-misses.size
+            self.cache_misses += misses.size
+        else:
+            misses = np.arange(num_rows)
+        if misses.size:
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put(({label:values[misses] for label,values in query.items()},future))
+            result[misses] = await future
+            if cache is not None:
+                cache.store(keys[misses],hashes[misses],result[misses])
+        self.requests += 1
+        self.rows_served += num_rows
+        self.latencies.append(time.perf_counter()-start)
+        return result
+
+    def _query(self,lon,lat,covariates):
+        lon,lat = Model.check_coordinates_batch(lon,lat)
+        if self.cache_decimals is not None:
+            lon,lat = np.round(lon,self.cache_decimals),np.round(lat,self.cache_decimals)
+        query = {"lon":lon,"lat":lat}
+        for label,values in sorted((covariates or {}).items()):
+            values = np.asarray(values).reshape(-1)
+            if values.shape != lon.shape:
+                raise ValueError(f"covariate {label} must have one value per position")
+            query[label] = values
+        return query
+
+    #----------------------- cache -----------------------#
+    def _cache(self,query):
+        '''returns: (PredictionCache, key words) for a query - one cache per set of covariate labels and
+                    dtypes - or (None, None) if the cache is off or the query has non-numeric covariates'''
+        if self.cache_size <= 0:
+            return None, None
+        keys = PredictionCache.keys(query)
+        if keys is None:
+            return None, None
+        signature = tuple((label,values.dtype.str) for label,values in query.items())
+        if signature not in self._caches:
+            self._caches[signature] = PredictionCache(self.cache_size)
+        return self._caches[signature], keys
+
+    def clear_cache(self):
+        'discards every cached prediction (e.g. after refitting the model)'
+        self._caches = {}
+
+    #----------------------- batching -----------------------#
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                self._pending = [await self._queue.get()]
+                num_rows = self._pending[0][0]["lon"].shape[0]
+                deadline = loop.time()+self.max_wait
+                while num_rows < self.max_batch_rows:
+                    try:
+                        item = self._queue.get_nowait() if deadline <= loop.time() else \
+                               await asyncio.wait_for(self._queue.get(),deadline-loop.time())
+                    except (asyncio.QueueEmpty,asyncio.TimeoutError):
+                        break
+                    self._pending.append(item)
+                    num_rows += item[0]["lon"].shape[0]
+                await self._predict_batch(loop,self._pending,num_rows)
+                self._pending = []
+        except asyncio.CancelledError:
+            # stopped while collecting or predicting a batch: its queries will never be answered
+            self._fail(self._pending)
+            self._pending = []
+            raise
+
+    async def _predict_batch(self,loop,pending,num_rows):
+        try:
+            batch = pd.DataFrame({label:np.concatenate([query[label] for query,_ in pending]) for label in pending[0][0]})
+            predictions = np.asarray(await loop.run_in_executor(None,self.model.predict,batch),dtype=float)
+        except Exception as error:
+            for _,future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batches += 1
+        self.rows_predicted += num_rows
+        start = 0
+        for query,future in pending:
+            stop = start+query["lon"].shape[0]
+            if not future.done():
+                future.set_result(predictions[start:stop])
+            start = stop
+
+    #----------------------- statistics -----------------------#
+    def reset_stats(self):
+        'restarts the counters, latencies and throughput clock'
+        self.requests = 0
+        self.rows_served = 0
+        self.rows_predicted = 0
+        self.batches = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.latencies.clear()
+        self._stats_start = time.perf_counter()
+
+    def stats(self):
+        '''returns: dict of request and row counts, batching and cache statistics, request latency
+                    percentiles (milliseconds) and throughput (per second) since the last reset'''
+        elapsed = time.perf_counter()-self._stats_start
+        latencies = 1e3*np.asarray(self.latencies)
+        p50,p90,p99 = np.percentile(latencies,[50,90,99]) if latencies.size else (np.nan,)*3
+        lookups = self.cache_hits+self.cache_misses
+        return {"requests":self.requests,"rows_served":self.rows_served,"rows_predicted":self.rows_predicted,
+                "batches":self.batches,"mean_batch_rows":self.rows_predicted/self.batches if self.batches else np.nan,
+                "cache_hits":self.cache_hits,"cache_hit_rate":self.cache_hits/lookups if lookups else np.nan,
+                "latency_p50_ms":p50,"latency_p90_ms":p90,"latency_p99_ms":p99,
+                "latency_max_ms":latencies.max() if latencies.size else np.nan,
+                "requests_per_second":self.requests/elapsed,"rows_per_second":self.rows_served/elapsed}
@@ -0,0 +1,118 @@
+'description: spatial index over drifter positions for nearest-neighbour, radius and lat/lon box queries'
+
+##### import packages #####
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS = 6.371e6 # mean earth radius in metres
+
+def to_unit_sphere(lon,lat):
+    '''returns: (N,3) cartesian coordinates of (lon,lat) positions (degrees) on the unit sphere'''
+    lon = np.deg2rad(np.asarray(lon,dtype=float))
+    lat = np.deg2rad(np.asarray(lat,dtype=float))
+    return np.column_stack((np.cos(lat)*np.cos(lon),np.cos(lat)*np.sin(lon),np.sin(lat)))
+
+def haversine(lon1,lat1,lon2,lat2):
+    '''returns: great circle distance in metres between positions given in degrees (broadcasts)'''
+    lon1,lat1,lon2,lat2 = (np.deg2rad(np.asarray(x,dtype=float)) for x in (lon1,lat1,lon2,lat2))
+    a = np.square(np.sin((lat2-lat1)/2))+np.cos(lat1)*np.cos(lat2)*np.square(np.sin((lon2-lon1)/2))
+    return 2*EARTH_RADIUS*np.arcsin(np.sqrt(np.clip(a,0.,1.)))
+
+def chord_to_distance(chord):
+    'converts straight-line distances between points on the unit sphere to great circle distances in metres'
+    return 2*EARTH_RADIUS*np.arcsin(np.clip(np.asarray(chord)/2,0.,1.))
+
+def distance_to_chord(distance):
+    'converts great circle distances in metres to straight-line distances between points on the unit sphere'
+    return 2*np.sin(np.clip(np.asarray(distance,dtype=float)/EARTH_RADIUS,0.,np.pi)/2)
+
+class SpatialIndex:
+    '''
+    index over the `lon`/`lat` positions of a dataset. a KD tree over the positions on the unit
+    sphere answers k-nearest and radius queries - straight-line (chord) distance is monotonic in
+    great circle distance, so the results are exact in haversine distance - and a latitude-sorted
+    copy of the positions answers lat/lon box queries with a binary search.
+    all queries take arrays of query points and return row positions into the indexed data.
+    '''
+    def __init__(self,data):
+        self.lon = np.asarray(data["lon"],dtype=float)
+        self.lat = np.asarray(data["lat"],dtype=float)
+        self.tree = cKDTree(to_unit_sphere(self.lon,self.lat))
+        self.lat_order = np.argsort(self.lat,kind="stable")
+        self.sorted_lat = self.lat[self.lat_order]
+
+    def __len__(self):
+        return self.lon.shape[0]
+
+    def nearest(self,lon,lat,k:int=1):
+        '''
+        returns: (distances, indices) - (M,k) arrays of the great circle distances (metres) to, and row
+                 positions of, the k nearest indexed points to each of the M query positions. when fewer than
+                 k points are indexed, the missing neighbours have distance inf and index -1.
+
+        params:
+        [array] lon, lat: query positions in degrees
+        [int] k: number of neighbours
+        '''
+        chord,indices = self.tree.query(to_unit_sphere(np.ravel(lon),np.ravel(lat)),k=[*range(1,k+1)])
+        missing = indices == len(self) # cKDTree pads missing neighbours with index n and an infinite distance
+        return np.where(missing,np.inf,chord_to_distance(chord)), np.where(missing,-1,indices)
+
+    def within_radius(self,lon,lat,radius):
+        '''
+        returns: list of arrays (one per query position) of the row positions within radius metres
+
+        params:
+        [array] lon, lat: query positions in degrees
+        [float or array] radius: great circle radius in metres (one for all queries, or one per query)
+        '''
+        points = to_unit_sphere(np.ravel(lon),np.ravel(lat))
+        chord = np.broadcast_to(distance_to_chord(radius),points.shape[:1])
+        neighbours = self.tree.query_ball_point(points,chord*(1+1e-12),return_sorted=True)
+        return [np.asarray(rows,dtype=np.intp) for rows in neighbours]
+
+    def within_box(self,lon_min,lon_max,lat_min,lat_max):
+        '''
+        returns: list of arrays (one per box) of the (ascending) row positions inside each lat/lon box.
+                 a box with lon_min > lon_max crosses the antimeridian.
+
+        params:
+        [float or array] lon_min, lon_max, lat_min, lat_max: box bounds in degrees
+        '''
+        lon_min,lon_max,lat_min,lat_max = np.broadcast_arrays(*(np.atleast_1d(np.asarray(x,dtype=float))
+                                                                for x in (lon_min,lon_max,lat_min,lat_max)))
+        starts = np.searchsorted(self.sorted_lat,lat_min,side="left")
+        stops = np.searchsorted(self.sorted_lat,lat_max,side="right")
+        boxes = []
+        for start,stop,west,east in zip(starts,stops,lon_min,lon_max):
+            rows = self.lat_order[start:stop]
+            lon = self.lon[rows]
+            inside = (lon >= west) & (lon <= east) if west <= east else (lon >= west) | (lon <= east)
+            boxes.append(np.sort(rows[inside]))
+        return boxes
+
+def regional_loss(model,boxes,test_or_train:str="test"):
+    '''
+    returns: dataframe with the model's loss and uncertainty (and number of rows) inside each lat/lon
+             box, computed from the model's memoised observations and predictions
+
+    params:
+    [Model] model: model to evaluate
+    [DataFrame or array] boxes: columns (or an (B,4) array of) lon_min, lon_max, lat_min, lat_max
+    [str] test_or_train: data subset to evaluate
+    '''
+    boxes = pd.DataFrame(np.asarray(boxes,dtype=float) if not isinstance(boxes,pd.DataFrame) else boxes,
+                         columns=["lon_min","lon_max","lat_min","lat_max"])
+    obs = model.observations(test_or_train)
+    preds = np.asarray(model.prediction(test_or_train))
+    rows = model.spatial_index(test_or_train).within_box(boxes["lon_min"],boxes["lon_max"],boxes["lat_min"],boxes["lat_max"])
+    losses,uncertainties = [],[]
+    for index in rows:
+        if index.size:
+            losses.append(model.loss_function(obs[index],preds[index]))
+            uncertainties.append(model.uncertainty_function(obs[index],preds[index]))
+        else:
+            losses.append(np.nan)
+            uncertainties.append(np.nan)
+    return boxes.assign(count=[index.size for index in rows],loss=losses,uncertainty=uncertainties)
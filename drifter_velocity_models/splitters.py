@@ -0,0 +1,154 @@
+'description: fold strategies for splitting drifter data into training and test sets'
+
+##### import packages #####
+import numpy as np
+import pandas as pd
+
+class BlockSplitter:
+    '''
+    parent class of the fold strategies. rows are grouped into blocks (`block_index`, overridden by
+    each subclass) and whole blocks are assigned to folds, so neighbouring drifter fixes never
+    end up on both sides of a split. used directly, the blocks are given by groups: a column label
+    (e.g. the drifter `id`) or an array with a group label for every row; by default every row is
+    its own block.
+
+    the assignment is computed once per dataset and stored as compact integer arrays: the fold of
+    every row, and the row positions ordered by fold. the test rows of each fold are then a
+    contiguous slice - a view - of that ordering.
+    '''
+    def __init__(self,n_splits:int=5,shuffle:bool=True,random_state=None,groups=None):
+        if n_splits < 2:
+            raise ValueError("n_splits must be at least 2")
+        self.n_splits = n_splits
+        self.shuffle = shuffle
+        self.random_state = random_state
+        self.groups = groups
+        self.fold_index = None # fold of every row
+        self.order = None # row positions sorted by fold
+        self.boundaries = None # fold f occupies order[boundaries[f]:boundaries[f+1]]
+        self._fitted_to = None
+
+    def block_index(self,data):
+        '''returns: block label of every row of data'''
+        if self.groups is None:
+            return np.arange(len(data))
+        if isinstance(self.groups,str):
+            return np.asarray(data[self.groups])
+        groups = np.asarray(self.groups)
+        if groups.shape != (len(data),):
+            raise ValueError(f"groups must hold one label for each of the {len(data)} rows")
+        return groups
+
+    #------------------------ fold assignment -------------------------#
+    def fit(self,data):
+        '''computes (or reuses, if data is the dataset already fitted) the fold of every row of data'''
+        if self._fitted_to is not None and self._fitted_to[0] is data and self._fitted_to[1] == len(data):
+            return self
+        _,blocks = np.unique(np.asarray(self.block_index(data)),return_inverse=True)
+        blocks = blocks.reshape(-1)
+        num_blocks = blocks.max()+1 if blocks.size else 0
+        if num_blocks < self.n_splits:
+            raise ValueError(f"cannot assign {num_blocks} blocks to {self.n_splits} folds")
+        block_order = np.arange(num_blocks)
+        if self.shuffle:
+            np.random.default_rng(self.random_state).shuffle(block_order)
+        block_fold = np.empty(num_blocks,dtype=np.min_scalar_type(self.n_splits))
+        block_fold[block_order] = np.arange(num_blocks)*self.n_splits//num_blocks
+        self.fold_index = block_fold[blocks]
+        self.order = np.argsort(self.fold_index,kind="stable").astype(np.min_scalar_type(max(len(data)-1,0)))
+        self.boundaries = np.searchsorted(self.fold_index[self.order],np.arange(self.n_splits+1))
+        self._fitted_to = (data,len(data))
+        return self
+
+    def test_index(self,fold:int):
+        '''returns: row positions (ascending) of the test set of fold - a view of `order`, not a copy'''
+        return self.order[self.boundaries[fold]:self.boundaries[fold+1]]
+
+    def train_index(self,fold:int):
+        '''returns: row positions (ascending) of the training set of fold'''
+        return np.sort(np.concatenate((self.order[:self.boundaries[fold]],self.order[self.boundaries[fold+1]:])))
+
+    def split(self,data):
+        '''
+        yields: (train_index, test_index) integer arrays of row positions for every fold
+
+        params:
+        [DataFrame] data: dataset to split
+        '''
+        self.fit(data)
+        for fold in range(self.n_splits):
+            yield self.train_index(fold), self.test_index(fold)
+
+    #------------------------ applying folds -------------------------#
+    def fold_data(self,data,fold:int):
+        '''
+        returns: (training_data, test_data) for fold, selected from data by row position. a set whose
+                 rows are contiguous in data (e.g. every test set of an unshuffled KFoldSplitter or
+                 TimeBlockSplitter) is a row slice - a view for ColumnarData - instead of a copy.
+        '''
+        self.fit(data)
+        return _take_rows(data,self.train_index(fold)), _take_rows(data,self.test_index(fold))
+
+    def apply(self,model,data,fold:int):
+        '''
+        sets the training_data and test_data of model to the given fold of data. the training_data setter
+        discards the model's fit to the previous fold (see Model.reset_fit), so one model can be reused
+        across folds and is refitted to each fold's training data on its next prediction.
+        '''
+        model.training_data,model.test_data = self.fold_data(data,fold)
+        return model
+
+def _take_rows(data,rows):
+    'returns: the rows of data at the (ascending, unique) positions rows - a slice when they are contiguous'
+    if rows.size == 0 or int(rows[-1])-int(rows[0])+1 == rows.size:
+        rows = slice(int(rows[0]),int(rows[-1])+1) if rows.size else slice(0,0)
+    return data.iloc[rows]
+
+class KFoldSplitter(BlockSplitter):
+    '''
+    splits the rows of a dataset into n_splits folds of (near) equal size. every fold is used as
+    the test set once, with the remaining folds as the training set.
+    '''
+    def block_index(self,data):
+        return np.arange(len(data))
+
+class SpatialBlockSplitter(BlockSplitter):
+    '''
+    assigns lon/lat tiles of lon_size x lat_size degrees to folds, so that drifter fixes in the
+    same tile are always on the same side of the split.
+    '''
+    def __init__(self,lon_size:float=10.,lat_size:float=10.,n_splits:int=5,shuffle:bool=True,random_state=None):
+        super().__init__(n_splits,shuffle,random_state)
+        if lon_size <= 0 or lat_size <= 0:
+            raise ValueError("tile sizes must be positive")
+        self.lon_size = lon_size
+        self.lat_size = lat_size
+
+    def block_index(self,data):
+        num_lon = int(np.ceil(360./self.lon_size))
+        lon_tile = np.floor((np.asarray(data["lon"],dtype=float)+180.)/self.lon_size).astype(np.int64)
+        lat_tile = np.floor((np.asarray(data["lat"],dtype=float)+90.)/self.lat_size).astype(np.int64)
+        return lat_tile*num_lon+np.minimum(lon_tile,num_lon-1)
+
+class TimeBlockSplitter(BlockSplitter):
+    '''
+    assigns consecutive time windows of length block_length to folds. by default the windows
+    are not shuffled, so each fold is a contiguous period of time.
+
+    params:
+    block_length: window length - a pandas timedelta string (e.g. "30D") for datetime columns,
+                  or a number in the units of a numeric time column
+    [str] time_column: label of the time column
+    '''
+    def __init__(self,block_length="30D",time_column:str="time",n_splits:int=5,shuffle:bool=False,random_state=None):
+        super().__init__(n_splits,shuffle,random_state)
+        self.block_length = block_length
+        self.time_column = time_column
+
+    def block_index(self,data):
+        times = data[self.time_column]
+        if pd.api.types.is_numeric_dtype(times):
+            times = np.asarray(times,dtype=float)
+            return np.floor((times-times.min())/self.block_length).astype(np.int64)
+        times = pd.to_datetime(times).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        return (times-times.min())//pd.Timedelta(self.block_length).value
@@ -0,0 +1,48 @@
+'description: chunked evaluation of model losses over drifter data that does not fit in memory'
+
+##### import packages #####
+from typing import List
+from model_classes import Model, ResidualStatistics
+from data_loader import DEFAULT_PATH, iter_data
+
+# accumulates the statistics behind every entry of `Model.loss_functions` and `Model.uncertainty_functions`
+# from batches of observations and predictions, with memory bounded by a single batch (`update`, `results`)
+RunningResidualStatistics = ResidualStatistics
+
+def iter_frame(data,chunksize:int=100_000):
+    '''yields: consecutive row chunks of an in-memory dataframe'''
+    for start in range(0,len(data),chunksize):
+        yield data.iloc[start:start+chunksize]
+
+def evaluate_chunks(model:Model,chunks,keys:List[str]=None):
+    '''
+    returns: RunningResidualStatistics accumulated over an iterable of data chunks, predicting each
+             chunk with the model's batch `predict` path.
+
+    params:
+    [Model] model: fitted model implementing `predict`
+    [iterable] chunks: dataframes holding `u`, `v` and whatever the model predicts from
+    [list] keys: residual statistics to accumulate (default: all of them, see Model.residual_statistics)
+    '''
+    statistics = RunningResidualStatistics(keys=keys)
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        statistics.update(model.extract_columns(chunk,["u","v"]),model.predict(chunk))
+    return statistics
+
+def streamed_loss(model:Model,path:str=DEFAULT_PATH,key:str=None,chunksize:int=100_000,columns:List[str]=None):
+    '''
+    returns: the model's (loss, uncertainty) over the dataset stored at path, as `Model.loss` would,
+             reading and predicting the data chunksize rows at a time.
+
+    params:
+    [Model] model: fitted model implementing `predict`
+    [str] path: path to the hdf5 file
+    [str] key: group identifier in the hdf5 file
+    [int] chunksize: maximum number of rows held in memory at once
+    [list] columns: only load these columns (must include `u`, `v` and the model's inputs)
+    '''
+    keys = Model.required_statistics([model.loss_type,model.uncertainty_type])
+    results = evaluate_chunks(model,iter_data(path,key=key,chunksize=chunksize,columns=columns),keys).results()
+    return results[model.loss_type], results[model.uncertainty_type]
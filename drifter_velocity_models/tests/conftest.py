@@ -0,0 +1,22 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# the modules of the package import each other by bare name
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from performance_benchmarks import synthetic_drifter_data
+
+@pytest.fixture
+def drifter_data():
+    'synthetic drifter data with a datetime `time` column'
+    data = synthetic_drifter_data(2_000,random_state=1)
+    data["time"] = pd.date_range("2020-01-01",periods=len(data),freq="h")
+    return data
+
+@pytest.fixture
+def split_data(drifter_data):
+    'the first 1500 rows of drifter_data for training and the rest for testing'
+    return drifter_data.iloc[:1_500],drifter_data.iloc[1_500:]
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from advection import advect
+from spatial_index import EARTH_RADIUS
+
+def uniform_eastward(lon,lat,t):
+    return np.column_stack((np.ones_like(lon),np.zeros_like(lat)))
+
+@pytest.mark.parametrize("arguments",[{"dt":0.},{"dt":np.nan},{"dt":np.inf},{"duration":np.inf},
+                                      {"save_interval":0},{"save_interval":1.5},
+                                      {"method":"rk23","tolerance":0.},{"method":"leapfrog"}])
+def test_invalid_arguments_raise(arguments,tmp_path):
+    path = tmp_path/"trajectories.h5"
+    arguments = {"duration":3600.,"dt":600.,"path":str(path),**arguments}
+    with pytest.raises(ValueError):
+        advect(uniform_eastward,[0.],[0.],**arguments)
+    assert not path.exists()
+
+@pytest.mark.parametrize("method",["euler","rk4","rk23"])
+def test_uniform_flow(method):
+    times,lon,lat = advect(uniform_eastward,[0.,10.],[0.,0.],duration=86_400.,dt=3_600.,method=method)
+    assert times[-1] == 86_400.
+    # 1 m/s east along the equator for a day
+    np.testing.assert_allclose(lon[-1]-lon[0],np.rad2deg(86_400./EARTH_RADIUS),rtol=1e-3)
+    np.testing.assert_allclose(lat[-1],0.)
+
+def test_save_interval():
+    times,lon,_ = advect(uniform_eastward,[0.],[0.],duration=10*600.,dt=600.,method="euler",save_interval=3)
+    np.testing.assert_array_equal(times,[0.,1800.,3600.,5400.,6000.])
+    assert lon.shape == (5,1)
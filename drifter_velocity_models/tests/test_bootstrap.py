@@ -0,0 +1,28 @@
+import numpy as np
+from bootstrap import bootstrap_residuals, resampled_means
+from model_classes import Model
+
+def test_estimates_match_loss_functions():
+    residuals = np.random.default_rng(0).normal(size=(5_000,2))
+    intervals = bootstrap_residuals(residuals,num_replicates=50,random_state=0).set_index(["metric","component"])
+    zeros = np.zeros_like(residuals)
+    for metric,function in {**Model.loss_functions,**Model.uncertainty_functions}.items():
+        expected = np.atleast_1d(function(residuals,zeros))
+        np.testing.assert_allclose(intervals.loc[metric,"estimate"],expected,rtol=1e-9)
+
+def test_resample_counts_sum_to_rows():
+    rng = np.random.default_rng(0)
+    np.testing.assert_allclose(resampled_means(np.ones((1_000,1)),7,rng,chunk_size=50),1.)
+    sizes = rng.integers(1,5,300).astype(float)
+    np.testing.assert_allclose(resampled_means(sizes[:,None],5,rng,sizes=sizes,chunk_size=64),1.)
+
+def test_replicate_spread_of_large_offsets():
+    residuals = 1e4+1e-3*np.random.default_rng(0).normal(size=(20_000,2))
+    intervals = bootstrap_residuals(residuals,["sre"],num_replicates=200,random_state=0)
+    assert intervals["lower"][0] < Model.to_cm_per_second(np.std(residuals)) < intervals["upper"][0]
+
+def test_result_depends_only_on_random_state():
+    residuals = np.random.default_rng(1).normal(size=(2_000,2))
+    first = bootstrap_residuals(residuals,num_replicates=100,random_state=3,batch_size=30,max_workers=1)
+    second = bootstrap_residuals(residuals,num_replicates=100,random_state=3,batch_size=30,max_workers=4)
+    np.testing.assert_array_equal(first[["lower","upper"]],second[["lower","upper"]])
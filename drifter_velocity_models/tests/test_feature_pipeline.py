@@ -0,0 +1,49 @@
+import gc
+import numpy as np
+import pandas as pd
+import pytest
+from columnar_data import ColumnarData
+from feature_pipeline import FeatureCache, FeaturePipeline
+
+@pytest.fixture
+def pipeline():
+    return FeaturePipeline()
+
+def test_cache_hit_returns_same_values(pipeline,drifter_data):
+    cache = FeatureCache()
+    feature = pipeline.features["sin_lon"]
+    first = cache.get(drifter_data,feature)
+    assert cache.get(drifter_data,feature) is first
+    assert len(cache) == 1
+
+def test_freed_inputs_are_evicted(pipeline,drifter_data):
+    cache = FeatureCache()
+    feature = pipeline.features["drifter_speed"]
+    frame = drifter_data[["u","v"]].copy()
+    cache.get(frame,feature)
+    assert len(cache) == 1
+    del frame
+    gc.collect()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+def test_reused_address_is_not_a_hit(pipeline):
+    cache = FeatureCache()
+    feature = pipeline.features["drifter_speed"]
+    for scale in range(1,20):
+        # frames of the same shape, allocated one after another, often reuse the freed memory
+        frame = pd.DataFrame({"u":np.full(1_000,float(scale)),"v":np.zeros(1_000)})
+        np.testing.assert_allclose(cache.get(frame,feature),scale)
+        del frame
+
+def test_columnar_data_keyed_by_contents(pipeline,drifter_data):
+    cache = FeatureCache()
+    feature = pipeline.features["cos_lat"]
+    first = cache.get(ColumnarData.from_dataframe(drifter_data),feature)
+    assert cache.get(ColumnarData.from_dataframe(drifter_data),feature) is first
+
+def test_cache_is_bounded_by_bytes(pipeline,drifter_data):
+    feature_bytes = len(drifter_data)*8
+    cache = FeatureCache(max_bytes=2*feature_bytes)
+    for label in ("sin_lon","cos_lon","sin_lat"):
+        cache.get(drifter_data,pipeline.features[label])
+    assert len(cache) == 2 and cache.nbytes <= cache.max_bytes
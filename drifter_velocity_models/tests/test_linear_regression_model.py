@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from linear_regression_model import LinearRegressionModel
+from performance_benchmarks import covariate_labels
+
+@pytest.fixture
+def model(split_data):
+    training_data,test_data = split_data
+    return LinearRegressionModel("rmse","sre",training_data,test_data,covariate_labels(training_data))
+
+def test_partial_fit_matches_batch_fit(model):
+    model.calculate_param_estimate()
+    batch_estimate = model.param_estimate
+    for start in range(0,len(model.training_data),400):
+        model.partial_fit(model.training_data.iloc[start:start+400])
+    assert model.num_fitted == len(model.training_data)
+    np.testing.assert_allclose(model.param_estimate,batch_estimate,rtol=1e-10,atol=1e-12)
+
+def test_forgetting_factor_down_weights_old_batches(model):
+    old_batch = model.training_data.iloc[:750].copy()
+    old_batch[["u","v"]] += 5.
+    model.partial_fit(old_batch)
+    model.partial_fit(model.training_data.iloc[750:],forgetting_factor=1e-9)
+    forgetful_estimate = model.param_estimate
+    model.reset_sufficient_statistics()
+    model.partial_fit(model.training_data.iloc[750:])
+    np.testing.assert_allclose(forgetful_estimate,model.param_estimate,rtol=1e-6)
+
+def test_forgetting_factor_must_be_in_unit_interval(model):
+    with pytest.raises(ValueError):
+        model.partial_fit(model.training_data,forgetting_factor=0.)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import instrumentation
+from benchmark_models import SBRModel
+from model_classes import Model, ResidualStatistics
+
+types = [(loss_type,uncertainty_type) for loss_type in Model.loss_functions for uncertainty_type in Model.uncertainty_functions]
+
+@pytest.mark.parametrize("loss_type,uncertainty_type",types)
+def test_loss_matches_loss_functions(loss_type,uncertainty_type,split_data):
+    model = SBRModel(loss_type,uncertainty_type,*split_data)
+    obs,preds = model.observations("test"),model.testing_prediction
+    assert model.loss("test") == (model.loss_function(obs,preds),model.uncertainty_function(obs,preds))
+
+def test_statistics_match_numpy():
+    rng = np.random.default_rng(0)
+    residuals = rng.normal(size=(10_000,2))
+    statistics = ResidualStatistics().update(residuals,0.).statistics()
+    speed = np.hypot(residuals[:,0],residuals[:,1])
+    direction = np.arctan2(residuals[:,1],residuals[:,0])
+    np.testing.assert_allclose(statistics["rmse"],100*np.sqrt(np.mean(np.square(residuals))))
+    np.testing.assert_allclose(statistics["sre"],100*np.std(residuals))
+    np.testing.assert_allclose(statistics["rms_speed"],100*np.sqrt(np.mean(np.square(speed))))
+    np.testing.assert_allclose(statistics["std_speed"],100*np.std(speed))
+    np.testing.assert_allclose(statistics["rms_direction"],np.rad2deg(np.sqrt(np.mean(np.square(direction)))))
+
+def test_chunked_batches_match_single_pass():
+    residuals = np.random.default_rng(1).normal(size=(10_000,2))
+    single = ResidualStatistics().update(residuals,0.).statistics()
+    statistics = ResidualStatistics(chunk_size=1_000)
+    for start in range(0,len(residuals),3_333):
+        statistics.update(residuals[start:start+3_333],0.)
+    for key,value in statistics.statistics().items():
+        np.testing.assert_allclose(value,single[key],rtol=1e-12,atol=1e-9)
+
+def test_small_spread_about_large_mean():
+    residuals = 1e4+1e-3*np.random.default_rng(2).normal(size=(200_000,2))
+    statistics = ResidualStatistics().update(residuals,0.).statistics()
+    np.testing.assert_allclose(statistics["sre"],100*np.std(residuals),rtol=1e-6)
+    np.testing.assert_allclose(statistics["std_speed"],100*np.std(np.hypot(residuals[:,0],residuals[:,1])),rtol=1e-6)
+
+def test_instrumented_loss_times_each_function(split_data):
+    model = SBRModel("rms_s_d","sre",*split_data)
+    expected = model.loss("test")
+    model.clear_cache()
+    sink = instrumentation.MemorySink()
+    with instrumentation.profiling([sink]):
+        assert model.loss("test") == expected
+    names = set(sink.summary().index)
+    assert {"Model.loss","loss_function.rms_s_d","uncertainty_function.sre"} <= names
@@ -0,0 +1,48 @@
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from columnar_data import ColumnarData
+from model_selection import SharedFrame, attach_worker, worker_frame
+
+def _worker_columns():
+    frame = worker_frame()
+    return list(frame.columns),float(frame["u"].sum()),frame["time"].iloc[-1]
+
+def test_shared_frame_round_trip(drifter_data):
+    with SharedFrame(drifter_data) as shared:
+        shm,frame = SharedFrame.attach(shared.spec)
+        assert list(frame.columns) == list(drifter_data.columns)
+        pd.testing.assert_frame_equal(frame,drifter_data.reset_index(drop=True))
+        assert not frame["u"].to_numpy().flags.writeable
+        del frame
+        shm.close()
+
+def test_shared_frame_columnar_data(drifter_data):
+    data = ColumnarData.from_dataframe(drifter_data,dtype=np.float64)
+    with SharedFrame(data,["u","time","lon"]) as shared:
+        shm,frame = SharedFrame.attach(shared.spec)
+        assert list(frame.columns) == ["u","time","lon"]
+        np.testing.assert_array_equal(frame["u"],drifter_data["u"])
+        np.testing.assert_array_equal(frame["time"],drifter_data["time"])
+        del frame
+        shm.close()
+
+def test_shared_frame_workers(drifter_data):
+    with SharedFrame(drifter_data) as shared:
+        with ProcessPoolExecutor(max_workers=2,initializer=attach_worker,initargs=(shared.spec,)) as pool:
+            columns,u_sum,last_time = pool.submit(_worker_columns).result()
+    assert columns == list(drifter_data.columns)
+    assert np.isclose(u_sum,drifter_data["u"].sum())
+    assert last_time == drifter_data["time"].iloc[-1]
+
+def test_attaching_process_does_not_unlink(drifter_data):
+    with SharedFrame(drifter_data[["lon","lat"]]) as shared:
+        code = ("import sys; sys.path[:0] = sys.argv[1:]; from model_selection import SharedFrame; "
+                f"shm,frame = SharedFrame.attach({shared.spec!r}); del frame; shm.close()")
+        subprocess.run([sys.executable,"-c",code]+sys.path,check=True)
+        shm,frame = SharedFrame.attach(shared.spec)
+        assert len(frame) == len(drifter_data)
+        del frame
+        shm.close()
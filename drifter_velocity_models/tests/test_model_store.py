@@ -0,0 +1,54 @@
+import json
+import os
+import numpy as np
+import pytest
+from benchmark_models import SBRModel, FixedCurrentModel, GriddedCurrentModel
+from linear_regression_model import LinearRegressionModel
+from model_store import save_model, load_model, read_metadata, METADATA_FILE
+from performance_benchmarks import covariate_labels
+
+def models(training_data,test_data):
+    return [SBRModel("rmse","sre",training_data,test_data),
+            FixedCurrentModel("rms_s_d","sr_s_d",training_data,test_data),
+            GriddedCurrentModel("rmse","sre",training_data,test_data,lon_size=30.,lat_size=20.),
+            LinearRegressionModel("rmse","sre",training_data,test_data,covariate_labels(training_data))]
+
+@pytest.mark.parametrize("index",range(4))
+@pytest.mark.parametrize("mmap",[True,False])
+def test_save_load_round_trip(index,mmap,split_data,tmp_path):
+    training_data,test_data = split_data
+    model = models(training_data,test_data)[index]
+    save_model(model,tmp_path)
+    loaded = load_model(tmp_path,training_data,test_data,mmap=mmap)
+    assert type(loaded) is type(model)
+    assert loaded.model_type == model.model_type
+    np.testing.assert_array_equal(loaded.predict(test_data),model.predict(test_data))
+    assert loaded.loss("test") == model.loss("test")
+
+def test_load_warns_on_different_training_data(split_data,tmp_path):
+    training_data,test_data = split_data
+    save_model(FixedCurrentModel("rmse","sre",training_data,test_data),tmp_path)
+    with pytest.warns(UserWarning):
+        load_model(tmp_path,test_data)
+
+def test_unsupported_format_version(split_data,tmp_path):
+    training_data,test_data = split_data
+    save_model(SBRModel("rmse","sre",training_data,test_data),tmp_path)
+    path = os.path.join(tmp_path,METADATA_FILE)
+    with open(path) as file:
+        metadata = json.load(file)
+    metadata["format_version"] = -1
+    with open(path,"w") as file:
+        json.dump(metadata,file)
+    with pytest.raises(ValueError):
+        read_metadata(tmp_path)
+
+def test_ngboost_round_trip(split_data,tmp_path):
+    pytest.importorskip("ngboost")
+    from ng_boost_model import NGBoostModel
+    training_data,test_data = split_data
+    model = NGBoostModel("rmse","sre",training_data,test_data,covariate_labels(training_data),5)
+    save_model(model,tmp_path)
+    loaded = load_model(tmp_path)
+    assert loaded.target_columns == ["u","v"]
+    np.testing.assert_array_equal(loaded.predict(test_data),model.predict(test_data))
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from performance_benchmarks import covariate_labels
+
+ngboost = pytest.importorskip("ngboost")
+from ng_boost_model import NGBoostModel
+
+def test_curve_losses_are_aligned(split_data):
+    training_data,test_data = split_data
+    model = NGBoostModel("rmse","sre",training_data,test_data,covariate_labels(training_data),8)
+    model.ngboost_pr()
+    # ngboost's training loss of iteration n+1 is recorded before its update: the loss after n iterations
+    recorded = next(iter(model.model_function.evals_result["train"].values()))
+    np.testing.assert_allclose(model.validation_curve["train_loss"][:-1],recorded[1:])
+
+def test_early_stopping_holds_out_fixed_rows(split_data,monkeypatch):
+    training_data,test_data = split_data
+    model = NGBoostModel("rmse","sre",training_data,test_data,covariate_labels(training_data),5,early_stopping_rounds=3)
+    fitted_rows = []
+    partial_fit = ngboost.NGBoost.partial_fit
+    def recording_partial_fit(self,X,Y,X_val=None,Y_val=None,**kwargs):
+        fitted_rows.append((len(X),len(X_val)))
+        return partial_fit(self,X,Y,X_val=X_val,Y_val=Y_val,**kwargs)
+    monkeypatch.setattr(ngboost.NGBoost,"partial_fit",recording_partial_fit)
+    model.ngboost_pr()
+    held_out = model.validation_split()
+    model.warm_start(3)
+    np.testing.assert_array_equal(model.validation_split(),held_out)
+    assert fitted_rows == [(len(training_data)-held_out.sum(),held_out.sum())]*2
@@ -0,0 +1,70 @@
+import asyncio
+import numpy as np
+import pytest
+from linear_regression_model import LinearRegressionModel
+from performance_benchmarks import covariate_labels
+from scoring_service import PredictionCache, ScoringService
+
+@pytest.fixture
+def model(split_data):
+    training_data,test_data = split_data
+    model = LinearRegressionModel("rmse","sre",training_data,test_data,covariate_labels(training_data))
+    model.calculate_param_estimate()
+    return model
+
+def serve(service,*queries):
+    'returns: the predictions of the queries, answered in turn by service'
+    async def run():
+        async with service:
+            return [await service.predict(*query) for query in queries]
+    return asyncio.run(run())
+
+def test_repeated_queries_hit_the_cache(model):
+    data = model.test_data
+    covariates = {label:data[label].to_numpy() for label in model.covariate_labels}
+    service = ScoringService(model)
+    first,second = serve(service,*[(data["lon"],data["lat"],covariates)]*2)
+    np.testing.assert_array_equal(first,second)
+    assert service.stats()["cache_hits"] == len(data)
+    assert service.rows_predicted == len(data)
+
+def test_cached_predictions_match_the_model_on_snapped_positions(model):
+    data = model.test_data.copy()
+    covariates = {label:data[label].to_numpy() for label in model.covariate_labels}
+    service = ScoringService(model,cache_decimals=2)
+    _,cached = serve(service,*[(data["lon"],data["lat"],covariates)]*2)
+    data[["lon","lat"]] = data[["lon","lat"]].round(2)
+    np.testing.assert_allclose(cached,model.predict(data))
+
+def test_covariates_are_part_of_the_cache_key(model):
+    lon,lat = np.zeros(3),np.zeros(3)
+    covariates = lambda value: {label:np.full(3,value) for label in model.covariate_labels}
+    service = ScoringService(model)
+    low,high = serve(service,(lon,lat,covariates(0.)),(lon,lat,covariates(1.)))
+    assert service.cache_hits == 0
+    assert not np.allclose(low,high)
+
+def test_cache_evicts_least_recently_used_rows():
+    cache = PredictionCache(size=4)
+    result = np.empty((4,2))
+    for start in (0,2,4):
+        keys = PredictionCache.keys({"lon":np.arange(start,start+4.),"lat":np.zeros(4)})
+        hashes = cache.hashes(keys)
+        misses = cache.lookup(keys,hashes,result)
+        cache.store(keys[misses],hashes[misses],np.column_stack([keys[misses,0].view(float)]*2))
+        assert len(cache) == 4
+    keys = PredictionCache.keys({"lon":np.arange(4,8.),"lat":np.zeros(4)})
+    assert cache.lookup(keys,cache.hashes(keys),result).size == 0
+    np.testing.assert_array_equal(result[:,0],np.arange(4,8.))
+
+def test_stop_fails_waiting_queries(model):
+    async def run():
+        service = ScoringService(model,max_wait=10.)
+        await service.start()
+        query = asyncio.ensure_future(service.predict(np.zeros(2),np.zeros(2),
+                                                      {label:np.zeros(2) for label in model.covariate_labels}))
+        await asyncio.sleep(0.01)
+        await service.stop()
+        with pytest.raises(RuntimeError):
+            await query
+    asyncio.run(run())
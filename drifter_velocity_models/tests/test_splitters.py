@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from columnar_data import ColumnarData
+from splitters import BlockSplitter, KFoldSplitter, SpatialBlockSplitter, TimeBlockSplitter
+
+splitters = [KFoldSplitter(random_state=0),KFoldSplitter(shuffle=False),
+             SpatialBlockSplitter(lon_size=60.,lat_size=40.,random_state=0),
+             TimeBlockSplitter(block_length="7D"),BlockSplitter(n_splits=4,groups="block")]
+
+@pytest.fixture
+def grouped_data(drifter_data):
+    drifter_data["block"] = np.arange(len(drifter_data))%13
+    return drifter_data
+
+@pytest.mark.parametrize("splitter",splitters,ids=lambda splitter: type(splitter).__name__)
+def test_folds_cover_every_row_once(splitter,grouped_data):
+    test_counts = np.zeros(len(grouped_data),dtype=int)
+    for train_index,test_index in splitter.split(grouped_data):
+        assert np.all(np.diff(train_index) > 0) and np.all(np.diff(test_index) > 0)
+        assert np.intersect1d(train_index,test_index).size == 0
+        assert train_index.size+test_index.size == len(grouped_data)
+        test_counts[test_index] += 1
+    assert np.all(test_counts == 1)
+
+@pytest.mark.parametrize("splitter",splitters,ids=lambda splitter: type(splitter).__name__)
+def test_blocks_stay_together(splitter,grouped_data):
+    splitter.fit(grouped_data)
+    blocks = np.asarray(splitter.block_index(grouped_data))
+    for block in np.unique(blocks):
+        assert np.unique(splitter.fold_index[blocks == block]).size == 1
+
+def test_fold_data_matches_split(drifter_data):
+    splitter = SpatialBlockSplitter(lon_size=60.,lat_size=40.,random_state=0)
+    for fold,(train_index,test_index) in enumerate(splitter.split(drifter_data)):
+        training_data,test_data = splitter.fold_data(drifter_data,fold)
+        assert training_data.index.equals(drifter_data.index[train_index])
+        assert test_data.index.equals(drifter_data.index[test_index])
+
+def test_contiguous_test_sets_are_views(drifter_data):
+    data = ColumnarData.from_dataframe(drifter_data)
+    splitter = KFoldSplitter(shuffle=False)
+    for fold in range(splitter.n_splits):
+        _,test_data = splitter.fold_data(data,fold)
+        assert np.shares_memory(test_data.block,data.block)
+
+def test_groups_array_must_match_rows(drifter_data):
+    with pytest.raises(ValueError):
+        BlockSplitter(groups=np.zeros(3)).fit(drifter_data)